@@ -0,0 +1 @@
+# bench
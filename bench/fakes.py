@@ -0,0 +1,230 @@
+# bench.fakes
+
+from typing import Any, Dict, List
+from io import BytesIO
+from threading import Lock
+import itertools
+import shutil
+
+from botocore.exceptions import ClientError
+
+from nexp.aliases import ListAny
+
+
+class FakeAirtable:
+    """Quacks like an airtable-python-wrapper client for one table, serving
+    records out of memory with Airtable's page size"""
+
+    API_LIMIT = 0
+    page_size = 100
+
+    def __init__(self, table_name: str, records: ListAny) -> None:
+        self.table_name = table_name
+        self.records = records
+        self.url_table = f"https://api.airtable.com/v0/bench/{table_name}"
+        self.requests = 0
+        self.__ids = itertools.count()
+        self.__lock = Lock()
+
+    def _get(self, url: str, offset: Any = None, **options: Any) -> dict:
+        with self.__lock:
+            self.requests += 1
+
+        # We don't evaluate formulas; every record "changed" since whenever
+        start = int(offset or 0)
+        page = self.records[start : start + self.page_size]
+
+        fields = options.get("fields")
+        if fields is not None:
+            page = [
+                {**r, "fields": {k: v for k, v in r["fields"].items() if k in fields}}
+                for r in page
+            ]
+
+        data: dict = {"records": page}
+        if start + self.page_size < len(self.records):
+            data["offset"] = str(start + self.page_size)
+        return data
+
+    def get_iter(self, **options: Any) -> Any:
+        offset = None
+        while True:
+            data = self._get(self.url_table, offset=offset, **options)
+            yield data["records"]
+
+            offset = data.get("offset")
+            if not offset:
+                break
+
+    def get_all(self, **options: Any) -> ListAny:
+        return [r for page in self.get_iter(**options) for r in page]
+
+    def __created(self, fields: dict) -> dict:
+        with self.__lock:
+            id_ = f"recBench{self.table_name[:3]}{next(self.__ids)}"
+        return {"id": id_, "createdTime": "2020-05-01T00:00:00.000Z", "fields": fields}
+
+    def insert(self, fields: dict) -> dict:
+        with self.__lock:
+            self.requests += 1
+        return self.__created(fields)
+
+    def update(self, record_id: str, fields: dict) -> dict:
+        with self.__lock:
+            self.requests += 1
+        return {"id": record_id, "fields": fields}
+
+    def _post(self, url: str, json_data: dict) -> dict:
+        with self.__lock:
+            self.requests += 1
+        return {"records": [self.__created(r["fields"]) for r in json_data["records"]]}
+
+    def _patch(self, url: str, json_data: dict) -> dict:
+        with self.__lock:
+            self.requests += 1
+        return {"records": json_data["records"]}
+
+
+class FakeAirtableBase:
+    """Hands out FakeAirtable tables, for Data's airtable_factory"""
+
+    def __init__(self, tables: Dict[str, ListAny]) -> None:
+        self.tables = {name: FakeAirtable(name, r) for name, r in tables.items()}
+
+    def __call__(self, table_name: str) -> FakeAirtable:
+        return self.tables.setdefault(table_name, FakeAirtable(table_name, []))
+
+    @property
+    def requests(self) -> int:
+        return sum(t.requests for t in self.tables.values())
+
+
+class FakeSendGrid:
+    """Quacks like a SendGridAPIClient, accepting every mail/send"""
+
+    class Response:
+        status_code = 202
+        body = b""
+        headers: Dict[str, str] = {}
+
+    def __init__(self) -> None:
+        self.client = self
+        self.mail = self
+        self.send = self
+        self.requests = 0
+        self.personalizations = 0
+        self.__lock = Lock()
+
+    def post(self, request_body: dict) -> "FakeSendGrid.Response":
+        with self.__lock:
+            self.requests += 1
+            self.personalizations += len(request_body["personalizations"])
+        return self.Response()
+
+
+class FakeS3Client:
+    """The handful of boto3 S3 client calls Blobs makes, backed by a dict"""
+
+    def __init__(self) -> None:
+        self.objects: Dict[str, bytes] = {}
+        self.requests = 0
+        self.__lock = Lock()
+
+    def __put(self, key: str, body: bytes) -> None:
+        with self.__lock:
+            self.requests += 1
+            self.objects[key] = body
+
+    def __get(self, key: str, operation: str) -> bytes:
+        with self.__lock:
+            self.requests += 1
+            if key not in self.objects:
+                raise ClientError({"Error": {"Code": "404"}}, operation)
+            return self.objects[key]
+
+    def upload_file(self, filepath: str, bucket: str, key: str, **kwargs: Any):
+        with open(filepath, "rb") as f:
+            self.__put(key, f.read())
+
+    def upload_fileobj(self, fileobj: Any, bucket: str, key: str, **kwargs: Any):
+        self.__put(key, fileobj.read())
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs: Any):
+        self.__put(Key, Body)
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {"ContentLength": len(self.__get(Key, "HeadObject"))}
+
+    def get_object(self, Bucket: str, Key: str) -> dict:
+        return {"Body": BytesIO(self.__get(Key, "GetObject"))}
+
+    def download_file(self, bucket: str, key: str, filepath: str) -> None:
+        body = self.__get(key, "GetObject")
+        with open(filepath, "wb") as f:
+            shutil.copyfileobj(BytesIO(body), f)
+
+    def generate_presigned_url(self, operation: str, Params: dict, **kwargs):
+        return f"https://bench.s3.amazonaws.com/{Params['Key']}"
+
+
+class FakeS3:
+    """Quacks like a boto3 S3 resource, as far as Blobs is concerned"""
+
+    class Meta:
+        def __init__(self, client: FakeS3Client) -> None:
+            self.client = client
+
+    def __init__(self) -> None:
+        self.meta = self.Meta(FakeS3Client())
+
+
+class FakeWorksheet:
+    def __init__(self, title: str) -> None:
+        self.title = title
+        self.rows = 1000
+        self.cols = 26
+        self.cells = 0
+
+
+class FakeSpreadsheet:
+    id = "bench"
+
+    def __init__(self, google: "FakeGoogle") -> None:
+        self.google = google
+
+    def worksheet_by_title(self, title: str) -> FakeWorksheet:
+        return self.google.worksheets.setdefault(title, FakeWorksheet(title))
+
+
+class FakeGoogle:
+    """Quacks like a pygsheets client, counting the cells we write instead of
+    writing them anywhere"""
+
+    def __init__(self) -> None:
+        self.worksheets: Dict[str, FakeWorksheet] = {}
+        self.requests = 0
+        self.cells = 0
+        self.sheet = self
+        self.service = self
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.requests += 1
+        return FakeSpreadsheet(self)
+
+    # The bits of the discovery service SheetsBatch uses
+    def spreadsheets(self) -> "FakeGoogle":
+        return self
+
+    def values(self) -> "FakeGoogle":
+        return self
+
+    def batchUpdate(self, spreadsheetId: str, body: dict) -> dict:
+        return body
+
+    def _execute_requests(self, body: dict) -> None:
+        self.requests += 1
+        for data in body["data"]:
+            self.cells += sum(len(row) for row in data["values"])
+
+    def values_batch_clear(self, spreadsheet_id: str, ranges: List[str]) -> None:
+        self.requests += 1
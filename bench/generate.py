@@ -0,0 +1,149 @@
+# bench.generate
+
+from typing import Dict
+from datetime import datetime, timedelta
+import random
+
+from nexp.aliases import ListAny
+
+# Small pools of values so that matches actually happen
+PRACTICES = (
+    "RN",
+    "LPN",
+    "CNA",
+    "Respiratory Therapist",
+    "Physician",
+    "Nurse Practitioner",
+    "Physician Assistant",
+    "Pharmacist",
+    "Paramedic",
+    "Medical Assistant",
+)
+REGIONS = tuple(f"Region {i}" for i in range(1, 12))
+CONFIG = {
+    "send_email_from": "bench@example.com",
+    "candidates_template_id": "d-candidates",
+    "no_candidates_template_id": "d-no-candidates",
+    "needs_template_id": "d-needs",
+    "tracking_template_id": "d-tracking",
+    "unsubscribe_group_id": "1",
+    "feedback_form_url": "https://example.com/feedback",
+    "needs_form_url": "https://example.com/needs",
+}
+
+EPOCH = datetime(2020, 4, 1)
+
+
+def timestamp(rng: random.Random, days: int = 60) -> str:
+    moment = EPOCH + timedelta(seconds=rng.randrange(days * 24 * 60 * 60))
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def record(id_: str, fields: dict, created_time: str) -> dict:
+    return {"id": id_, "createdTime": created_time, "fields": fields}
+
+
+def candidate(rng: random.Random, i: int) -> dict:
+    fields = {
+        "Name": f"Candidate {i}",
+        "Phone Number": f"(555) {i // 10000 % 1000:03d}-{i % 10000:04d}",
+        "Email Address": f"candidate{i}@example.com",
+        "High Priority Health Care Practice": rng.sample(PRACTICES, rng.randint(1, 2)),
+        "Additional Practice Areas": rng.sample(PRACTICES, rng.randint(0, 3)),
+        "Regional Availability": rng.sample(REGIONS, rng.randint(1, 3)),
+        "Practice Recency": rng.choice(["Currently practicing", "Within 5 years"]),
+        "License Status": rng.choice(["Active", "Inactive"]),
+        "License Number": f"L{i:08d}",
+        "Certifications": rng.sample(["BLS", "ACLS", "PALS"], rng.randint(0, 2)),
+        "FT v PT": rng.choice(["Full-time", "Part-time"]),
+        "Retirement Home Availability": rng.choice(["Yes", "No"]),
+        "Date Available": timestamp(rng)[:10],
+        "Notes About Availability": "Lorem ipsum dolor sit amet " * rng.randint(0, 4),
+        "City": "Baton Rouge",
+        "Zip Code": f"70{i % 1000:03d}",
+        "State": "LA",
+    }
+    if rng.random() < 0.05:
+        fields["Hired"] = True
+    if rng.random() < 0.05:
+        fields["Unavailable"] = True
+    return record(f"recCand{i}", fields, timestamp(rng))
+
+
+def facility(rng: random.Random, i: int) -> dict:
+    fields = {
+        "Facility Name": f"Facility {i}",
+        "Facility Type": [rng.choice(["Hospital", "Nursing Home", "Clinic"])],
+        "Contact Name": f"Contact {i}",
+        "Contact Email": f"facility{i}@example.com",
+        "Approved": rng.random() < 0.9,
+        "Region": [rng.choice(REGIONS)],
+    }
+    return record(f"recFac{i}", fields, timestamp(rng))
+
+
+def need(rng: random.Random, i: int, facilities: int) -> dict:
+    practices = rng.sample(PRACTICES, 3)
+    fields = {
+        "Facility": [f"recFac{rng.randrange(facilities)}"],
+        "Time Requested": timestamp(rng),
+        "Practice Area 1": practices[0],
+    }
+    if rng.random() < 0.5:
+        fields["Practice Area 2"] = practices[1]
+    if rng.random() < 0.2:
+        fields["Practice Area 3"] = practices[2]
+    if rng.random() < 0.3:
+        fields["Needs Met"] = rng.choice(["Yes", "No"])
+    return record(f"recNeed{i}", fields, timestamp(rng))
+
+
+def generate(
+    candidates: int = 10000,
+    facilities: int = 500,
+    needs: int = 750,
+    tags: int = 50,
+    tracking: int = 2000,
+    seed: int = 0,
+) -> Dict[str, ListAny]:
+    """Given how many of each kind of record to make, return synthetic records
+    for every table, keyed by table (candidates, facilities, needs,
+    candidate_tags, tracking, and config)"""
+    rng = random.Random(seed)
+
+    def some_candidates(most: int) -> ListAny:
+        count = min(rng.randint(1, most), candidates)
+        return [f"recCand{i}" for i in rng.sample(range(candidates), count)]
+
+    return {
+        "candidates": [candidate(rng, i) for i in range(candidates)],
+        "facilities": [facility(rng, i) for i in range(facilities)],
+        "needs": [need(rng, i, facilities) for i in range(needs)],
+        "candidate_tags": [
+            record(
+                f"recTag{i}",
+                {
+                    "Authorized Facilities": [f"recFac{rng.randrange(facilities)}"],
+                    "Candidates": some_candidates(20),
+                },
+                timestamp(rng),
+            )
+            for i in range(tags)
+        ],
+        "tracking": [
+            record(
+                f"recTrack{i}",
+                {
+                    "Facility": [f"recFac{rng.randrange(facilities)}"],
+                    "Mailing Type": "Candidate List",
+                    "Candidates": some_candidates(50),
+                },
+                timestamp(rng),
+            )
+            for i in range(tracking)
+        ],
+        "config": [
+            record(f"recConf{i}", {"Key": k, "Value": v}, timestamp(rng))
+            for i, (k, v) in enumerate(CONFIG.items())
+        ],
+    }
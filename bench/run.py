@@ -0,0 +1,156 @@
+# bench.run
+
+from typing import Any, Callable, List, Tuple
+from time import perf_counter
+import argparse
+import logging
+import resource
+import tracemalloc
+
+from nexp.aliases import OptionalString
+from nexp.clients.all import Clients
+from nexp.clients.blobs import Blobs
+from nexp.clients.data import Data
+from nexp.clients.email import Email
+from nexp.config import config
+from nexp.ratelimit import RateLimiter
+from nexp.tasks.send_candidate_lists import SendCandidateLists
+
+from bench.fakes import FakeAirtableBase, FakeGoogle, FakeS3, FakeSendGrid
+from bench.generate import generate
+
+
+def build_clients(
+    tables: dict, replay_dirpath: OptionalString = None
+) -> Tuple[Clients, FakeAirtableBase]:
+    """Given generated tables, return Clients wired up to in-process fakes.
+    Given a capture directory, Airtable reads are replayed from it instead."""
+    base = FakeAirtableBase(
+        {
+            getattr(config, f"airtable_{name}_table"): records
+            for name, records in tables.items()
+        }
+    )
+    data = Data(
+        api_key="bench",
+        base_id="bench",
+        incremental=False,
+        rate_limiter=RateLimiter(0),
+        airtable_factory=base,
+        google_client=FakeGoogle(),
+        capture="replay" if replay_dirpath else None,
+        capture_dirpath=replay_dirpath,
+    )
+    clients = Clients(
+        data, Email(FakeSendGrid()), Blobs(FakeS3(), "bench", "bench", 3600)
+    )
+    return clients, base
+
+
+class Phases:
+    """Times each phase of a run, and optionally tracks its peak memory"""
+
+    def __init__(self, trace_memory: bool = False) -> None:
+        self.trace_memory = trace_memory
+        self.results: List[Tuple[str, float, float, float]] = []
+
+    def run(self, name: str, fn: Callable[[], Any]) -> Any:
+        if self.trace_memory:
+            tracemalloc.start()
+
+        started = perf_counter()
+        result = fn()
+        seconds = perf_counter() - started
+
+        peak = 0.0
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+        # ru_maxrss is in kilobytes on Linux
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.results.append((name, seconds, peak, maxrss))
+        return result
+
+    def report(self) -> str:
+        lines = [f"{'phase':<28}{'seconds':>10}{'peak MB':>10}{'max RSS MB':>12}"]
+        for name, seconds, peak, maxrss in self.results:
+            peak_column = f"{peak:>10.1f}" if self.trace_memory else f"{'-':>10}"
+            lines.append(f"{name:<28}{seconds:>10.2f}{peak_column}{maxrss:>12.1f}")
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="NEXP Backend benchmarks")
+    parser.add_argument("--candidates", type=int, default=10000)
+    parser.add_argument("--facilities", type=int, default=500)
+    parser.add_argument("--needs", type=int, default=750)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--tracking", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=config.candidate_list_workers)
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=50,
+        help="how many facilities to run the per-facility match for",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIRPATH",
+        help="replay a capture recorded with NEXP_AIRTABLE_CAPTURE=record "
+        "instead of generating data",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        default=False,
+        help="track peak python memory per phase (slows everything down)",
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    phases = Phases(args.trace_memory)
+    tables = {}
+    if not args.replay:
+        tables = phases.run(
+            "generate",
+            lambda: generate(
+                args.candidates,
+                args.facilities,
+                args.needs,
+                args.tags,
+                args.tracking,
+                args.seed,
+            ),
+        )
+    clients, base = build_clients(tables, args.replay)
+    data = clients.data
+
+    phases.run("fill", data.fill)
+    matches = phases.run("match all facilities", data.candidates_for_facilities_in_need)
+
+    facilities = list(data.facilities_in_need())[: args.sample]
+    phases.run(
+        f"match {len(facilities)} facilities",
+        lambda: [list(data.candidates_for_facility(f)) for f in facilities],
+    )
+    phases.run(
+        "send candidate lists", SendCandidateLists(clients, workers=args.workers),
+    )
+    phases.run("fill sheets (rewrite)", data.fill_sheets)
+    phases.run("fill sheets (diff)", data.fill_sheets)
+
+    print(phases.report())
+    print()
+    print(
+        f"facilities in need: {len(list(data.facilities_in_need()))}; "
+        f"with matches: {len(matches)}; "
+        f"matched candidates: {sum(len(c) for c in matches.values())}; "
+        f"airtable requests: {base.requests}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,69 @@
 # handlers
 
+import logging
+
 from nexp.tasks.update_sheets import UpdateSheets
 from nexp.tasks.send_candidate_lists import SendCandidateLists
 from nexp.tasks.send_needs_requests import SendNeedsRequests
+from nexp.tasks.shard_candidate_lists import ShardCandidateLists, run_shard
 from nexp.clients.all import Clients
+from nexp.clients.messages import LambdaQueue
+from nexp.config import config
+from nexp.deadline import Deadline
+from nexp.metrics import metrics
 
 clients = Clients()
 
 
-def send_candidates_lists(*args):
-    # Always refill the local database
-    clients.data.fill()
-    run = SendCandidateLists(clients)
-    run()
+def send_candidates_lists(event, context):
+    # Reports where the run spent its time once it's over
+    with metrics.run("send-candidate-lists"):
+        deadline = Deadline.from_context(context)
+
+        # Later invocations each day pick up whatever earlier ones didn't get to
+        checkpoint = clients.checkpoints.load("send-candidate-lists")
+        if checkpoint.complete:
+            logging.info("Candidate lists already went out today.")
+            return  # Early Return
+
+        # Always refill the local database
+        clients.snapshots.fill(
+            "send-candidate-lists", fields=SendCandidateLists.required_fields()
+        )
+
+        # Hand the facilities off to shard workers rather than sending them here
+        if config.candidate_list_shards > 1:
+            queue = LambdaQueue(str(config.candidate_list_shard_function))
+            run = ShardCandidateLists(clients, queue, checkpoint=checkpoint)
+            run()
+            return  # Early Return
+
+        run = SendCandidateLists(clients, deadline=deadline, checkpoint=checkpoint)
+        run()
+
+
+def send_candidate_lists_shard(event, context):
+    with metrics.run("send-candidate-lists-shard"):
+        # Works from the snapshot the coordinator published, not from Airtable
+        run_shard(clients, event, Deadline.from_context(context))
 
 
 def send_needs_requests(*args):
-    # Always refill the local database
-    clients.data.fill()
-    run = SendNeedsRequests(clients)
-    run()
+    with metrics.run("send-needs-requests"):
+        # Always refill the local database
+        clients.snapshots.fill(
+            "send-needs-requests", fields=SendNeedsRequests.required_fields()
+        )
+        run = SendNeedsRequests(clients)
+        run()
 
 
 def update_sheets(*args):
-    # Always refill the local database
-    clients.data.fill()
-    run = UpdateSheets(clients)
-    run()
+    with metrics.run("update-sheets"):
+        # Always refill the local database
+        clients.snapshots.fill("update-sheets")
+        run = UpdateSheets(clients)
+        run()
+        # Keep the row fingerprints we just wrote so the next run can diff
+        # against them, even from a cold start
+        clients.snapshots.save("update-sheets")
@@ -5,6 +5,8 @@ from typing import Union
 from nexp.clients.data import Data
 from nexp.clients.email import Email
 from nexp.clients.blobs import Blobs
+from nexp.clients.checkpoints import Checkpoints
+from nexp.clients.snapshots import Snapshots
 
 
 class Clients:
@@ -19,3 +21,5 @@ class Clients:
         self.data = data or Data()
         self.email = email or Email()
         self.blobs = blobs or Blobs()
+        self.snapshots = Snapshots(self.data, self.blobs)
+        self.checkpoints = Checkpoints(self.blobs)
@@ -1,13 +1,15 @@
 # nexp.clients.blobs
 
-from typing import Any, Union
+from typing import Any, BinaryIO, Dict, Union
+from json import dumps, loads
 from os import path
+from urllib.parse import quote
 
 import boto3
+from botocore.exceptions import ClientError
 
 from nexp.aliases import OptionalString
 from nexp.config import config
-from nexp import utils
 
 
 class Blobs:
@@ -23,34 +25,112 @@ class Blobs:
         self.__prefix = str(prefix or config.s3_prefix)
         self.url_expiry_seconds = url_expiry_seconds or config.s3_url_expiry_seconds
 
-    def upload_file_and_presign(
+    def __presign(self, key: str, download_filename: OptionalString = None) -> str:
+        params = {"Bucket": self.__bucket, "Key": key}
+        if download_filename:
+            params[
+                "ResponseContentDisposition"
+            ] = f"attachment; filename*=UTF-8''{quote(download_filename)}"
+
+        return self.__resource.meta.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=self.url_expiry_seconds,
+        )
+
+    def exists(self, dirname: str, filename: str) -> bool:
+        """Given a dirname and a filename, is there already an object stored
+        there?"""
+        key = path.join(self.__prefix, dirname, filename)
+
+        try:
+            self.__resource.meta.client.head_object(Bucket=self.__bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise e
+
+        return True
+
+    def upload_fileobj(
         self,
-        source_filepath: str,
+        fileobj: BinaryIO,
         destination_dirname: str,
         destination_filename: str,
         content_type: str,
-    ) -> str:
-        """Given a source_filepath, a destination dirname, and a destination
-        filepath, upload the file at the source filepath to S3 and generate
-        a presigned URL that will allow folks to download it."""
-        key = path.join(
-            self.__prefix,
-            destination_dirname,
-            utils.date_string(),
-            destination_filename,
-        )
+        metadata: Union[Dict[str, str], None] = None,
+    ) -> None:
+        """Given a readable file object, a destination dirname, a destination
+        filename, a content type, and optionally some metadata, upload the file
+        to S3 under a key that doesn't change from day to day"""
+        key = path.join(self.__prefix, destination_dirname, destination_filename)
 
-        response = self.__resource.meta.client.upload_file(
-            source_filepath,
+        self.__resource.meta.client.upload_fileobj(
+            fileobj,
             self.__bucket,
             key,
-            ExtraArgs={"Metadata": {"Content-Type": content_type, "ACL": "private"}},
+            ExtraArgs={"ContentType": content_type, "Metadata": metadata or {}},
         )
 
-        response = self.__resource.meta.client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": self.__bucket, "Key": key,},
-            ExpiresIn=self.url_expiry_seconds,
+    def presign(
+        self, dirname: str, filename: str, download_filename: OptionalString = None
+    ) -> str:
+        """Given a dirname and filename uploaded with upload_fileobj, and
+        optionally the name the file should download as, generate a presigned
+        URL that will allow folks to download it"""
+        return self.__presign(
+            path.join(self.__prefix, dirname, filename), download_filename
         )
 
-        return response
+    def write_json(self, dirname: str, filename: str, data: Any) -> None:
+        """Given a dirname, a filename, and some data, store the data in S3 as
+        JSON, replacing whatever was stored there before"""
+        key = path.join(self.__prefix, dirname, filename)
+        self.__resource.meta.client.put_object(
+            Bucket=self.__bucket,
+            Key=key,
+            Body=dumps(data).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def read_json(self, dirname: str, filename: str) -> Any:
+        """Given a dirname and a filename written with write_json, read the data
+        back. Returns None if there's nothing there."""
+        key = path.join(self.__prefix, dirname, filename)
+
+        try:
+            response = self.__resource.meta.client.get_object(
+                Bucket=self.__bucket, Key=key
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise e
+
+        return loads(response["Body"].read())
+
+    def upload_file(
+        self, source_filepath: str, destination_dirname: str, destination_filename: str
+    ) -> None:
+        """Given a source_filepath, a destination dirname, and a destination
+        filename, upload the file at the source filepath to S3, replacing
+        whatever was stored there before"""
+        key = path.join(self.__prefix, destination_dirname, destination_filename)
+        self.__resource.meta.client.upload_file(source_filepath, self.__bucket, key)
+
+    def download_file(
+        self, source_dirname: str, source_filename: str, destination_filepath: str
+    ) -> bool:
+        """Given a source dirname, a source filename, and a destination
+        filepath, download a file uploaded with upload_file. Returns False if
+        there was nothing to download."""
+        key = path.join(self.__prefix, source_dirname, source_filename)
+
+        try:
+            self.__resource.meta.client.download_file(
+                self.__bucket, key, destination_filepath
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise e
+
+        return True
@@ -0,0 +1,122 @@
+# nexp.clients.capture
+
+from typing import Any, List
+from json import dumps, loads
+from threading import Lock
+import gzip
+import itertools
+import os
+
+from nexp.aliases import ListAny
+from nexp import utils
+
+
+def capture_filepath(dirpath: str, table_name: str) -> str:
+    """Given a capture directory and an Airtable table name, return where that
+    table's responses are kept"""
+    return os.path.join(dirpath, f"{'_'.join(table_name.lower().split())}.jsonl.gz")
+
+
+class RecordingAirtable:
+    """Wraps an Airtable client for one table, passing everything through to it
+    and writing every page of records it hands back to a gzipped JSON lines
+    file. Each listing (a first page request, without an offset) is written as
+    a request line followed by one line per page, so the capture keeps the
+    real pagination."""
+
+    def __init__(self, api: Any, dirpath: str, table_name: str) -> None:
+        self.api = api
+        self.url_table = getattr(api, "url_table", "")
+        self.API_LIMIT = 0
+        self.filepath = capture_filepath(dirpath, table_name)
+        self.__lock = Lock()
+        self.__started = False
+        utils.mkdirp(dirpath)
+
+    def _get(self, url: str, offset: Any = None, **params: Any) -> dict:
+        data = self.api._get(url, offset=offset, **params)
+
+        # Only listings are captured, not fetches of single records
+        if url != self.url_table:
+            return data
+
+        with self.__lock:
+            # Start the capture over the first time this run asks for the table
+            mode = "at" if self.__started else "wt"
+            self.__started = True
+
+            with gzip.open(self.filepath, mode) as f:
+                if offset is None:
+                    f.write(dumps({"request": params}) + "\n")
+                f.write(dumps({"page": data.get("records", [])}) + "\n")
+
+        return data
+
+    def __getattr__(self, name: str) -> Any:
+        # Writes and anything else go straight to the real client
+        return getattr(self.api, name)
+
+
+class ReplayAirtable:
+    """Serves a table's listings from a capture written by RecordingAirtable,
+    page for page, without touching the API. The nth listing gets the pages of
+    the nth recorded request (and the last one once we run out). Writes are
+    accepted and dropped."""
+
+    def __init__(self, dirpath: str, table_name: str) -> None:
+        self.table_name = table_name
+        self.url_table = f"replay/{table_name}"
+        self.API_LIMIT = 0
+        self.filepath = capture_filepath(dirpath, table_name)
+        self.__lock = Lock()
+        self.__calls = 0
+        self.__ids = itertools.count()
+        self.__requests = self.__load()
+
+    def __load(self) -> List[ListAny]:
+        requests: List[ListAny] = []
+        if not os.path.exists(self.filepath):
+            return requests
+
+        with gzip.open(self.filepath, "rt") as f:
+            for line in f:
+                entry = loads(line)
+                if "request" in entry:
+                    requests.append([])
+                elif requests:
+                    requests[-1].append(entry["page"])
+        return requests
+
+    def _get(self, url: str, offset: Any = None, **params: Any) -> dict:
+        if not self.__requests:
+            return {"records": []}
+
+        # Our offsets say which recorded request and which of its pages is next
+        if offset is None:
+            with self.__lock:
+                request = min(self.__calls, len(self.__requests) - 1)
+                self.__calls += 1
+            page = 0
+        else:
+            request, page = (int(x) for x in offset.split(":"))
+
+        pages = self.__requests[request]
+        data: dict = {"records": pages[page] if page < len(pages) else []}
+        if page + 1 < len(pages):
+            data["offset"] = f"{request}:{page + 1}"
+        return data
+
+    def __created(self, fields: dict) -> dict:
+        return {"id": f"recReplay{next(self.__ids)}", "fields": fields}
+
+    def insert(self, fields: dict) -> dict:
+        return self.__created(fields)
+
+    def update(self, record_id: str, fields: dict) -> dict:
+        return {"id": record_id, "fields": fields}
+
+    def _post(self, url: str, json_data: dict) -> dict:
+        return {"records": [self.__created(r["fields"]) for r in json_data["records"]]}
+
+    def _patch(self, url: str, json_data: dict) -> dict:
+        return {"records": json_data["records"]}
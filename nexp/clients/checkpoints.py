@@ -0,0 +1,114 @@
+# nexp.clients.checkpoints
+
+from typing import List, Union
+from threading import Lock
+import logging
+
+from nexp.clients.blobs import Blobs
+from nexp import utils
+
+
+class Checkpoint:
+    """Remembers which items a daily run already took care of, so that a run
+    that gets cut off can be picked back up by the next invocation that day.
+    Checkpoints are stored as JSON in S3.
+
+    Work handed off to other workers is tracked in parts: each worker marks
+    what it finishes in its own part, so none of them overwrite each other,
+    and loading the checkpoint merges in every part it knows about."""
+
+    # Save after this many items get marked done, so that a run that dies
+    # without cleaning up loses at most this much progress
+    __save_every = 25
+
+    def __init__(
+        self,
+        blobs: Blobs,
+        name: str,
+        date: Union[str, None] = None,
+        part: Union[str, None] = None,
+    ):
+        self.blobs = blobs
+        self.name = name
+        self.date = date or utils.filename_date_string()
+        self.part = part
+        self.complete = False
+        self.parts: List[str] = []
+        self.__done = set()
+        self.__unsaved = 0
+        self.__lock = Lock()
+
+    @property
+    def filename(self) -> str:
+        if self.part:
+            return f"{self.name}/{self.date}/{self.part}.json"
+        return f"{self.name}/{self.date}.json"
+
+    def load(self) -> "Checkpoint":
+        """Pick up whatever today's earlier runs (and the parts they handed
+        out) saved"""
+        state = self.blobs.read_json("checkpoints", self.filename) or {}
+        self.complete = state.get("complete", False)
+        self.parts = state.get("parts", [])
+        self.__done = set(state.get("done", []))
+
+        for part in self.parts:
+            self.__done.update(self.part_checkpoint(part).load().__done)
+
+        logging.info(
+            f"Loaded checkpoint. (name: {self.name}; date: {self.date}; part: {self.part}; done: {len(self.__done)}; complete: {self.complete})"
+        )
+        return self
+
+    def part_checkpoint(self, part: str) -> "Checkpoint":
+        """Given the name of a part, return its (unloaded) checkpoint"""
+        return Checkpoint(self.blobs, self.name, self.date, part)
+
+    def add_part(self, part: str) -> None:
+        """Given the name of a part, remember to merge it in when we're loaded.
+        Save the checkpoint before handing the part out."""
+        with self.__lock:
+            if part not in self.parts:
+                self.parts.append(part)
+
+    def is_done(self, id_: str) -> bool:
+        return id_ in self.__done
+
+    def mark(self, id_: str) -> None:
+        """Given an id, record that it's done"""
+        with self.__lock:
+            self.__done.add(id_)
+            self.__unsaved += 1
+            save = self.__unsaved >= self.__save_every
+
+        if save:
+            self.save()
+
+    def save(self, complete: Union[bool, None] = None) -> None:
+        """Write the checkpoint out. Given complete, also record whether the
+        whole run is finished."""
+        with self.__lock:
+            if complete is not None:
+                self.complete = complete
+            state = {
+                "complete": self.complete,
+                "done": sorted(self.__done),
+                "parts": self.parts,
+            }
+            self.__unsaved = 0
+
+        self.blobs.write_json("checkpoints", self.filename, state)
+
+
+class Checkpoints:
+    """Hands out checkpoints stored in a given Blobs client"""
+
+    def __init__(self, blobs: Blobs) -> None:
+        self.blobs = blobs
+
+    def load(
+        self, name: str, date: Union[str, None] = None, part: Union[str, None] = None
+    ) -> Checkpoint:
+        """Given a run's name, and optionally a date (today by default) and
+        the name of a part, load that checkpoint"""
+        return Checkpoint(self.blobs, name, date, part).load()
@@ -1,23 +1,45 @@
 # nexp.clients.data
 
-from typing import Any, Generator, List
+from typing import Any, Callable, Dict, Generator, Iterable, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from hashlib import sha1
 from json import dumps, loads
 from functools import cached_property
+from queue import Queue
+from threading import RLock
 import sqlite3
+import os
 import logging
 
 from airtable import Airtable
 from google.oauth2.credentials import Credentials
+from requests.exceptions import HTTPError
 import pygsheets
 
 from nexp.aliases import ListAny, OptionalString, GenAny
 from nexp.config import config
+from nexp.clients.capture import RecordingAirtable, ReplayAirtable
+from nexp.clients.profiling import QueryProfiler
+from nexp.clients.sheets import SheetsBatch
+from nexp.metrics import metrics
+from nexp.ratelimit import RateLimiter
 from nexp import utils
 
 ModelIterator = Generator[Any, None, None]
 
+# What fill_sheets saves about a worksheet: table name, header, rows used, row
+# fingerprints, and removed record ids
+SheetState = Tuple[str, List[str], int, List[Tuple[str, str, int, str]], List[str]]
+
 
 class Model:
+    """A record from one of our tables. The fields stay as the raw JSON we read
+    out of sqlite until something first asks for one of them, so listing a table
+    doesn't pay for decoding records nobody looks at."""
+
+    __slots__ = ("id_", "created_time", "__raw", "__fields", "__extra", "__columns")
+
     @classmethod
     def fix_key(cls, key: str) -> str:
         """Given a string, lowercase, strip, and turn spaces into underscores"""
@@ -28,30 +50,76 @@ class Model:
         """Given airtable data, turn it into a Model"""
         id_ = raw["id"]
         fields = {cls.fix_key(k): v for k, v in raw["fields"].items()}
-        return cls(id_, fields)
+        return cls(id_, fields, raw.get("createdTime"))
 
     @classmethod
-    def from_row(cls, row: List[str], for_lists: bool = False) -> Any:
+    def from_row(
+        cls,
+        row: List[str],
+        for_lists: bool = False,
+        columns: Union[ListAny, None] = None,
+    ) -> Any:
         """Given a SQL row, turn it into a Model"""
-        row_level_info = loads(row[1])
-
         if for_lists:
-            row_level_info["previouslySentGroup"] = row[2]
-            return cls(row[0], row_level_info)
+            return cls(
+                row[0],
+                raw=row[1],
+                extra={"previouslySentGroup": row[2]},
+                columns=columns,
+            )
 
-        return cls(row[0], loads(row[1]))
+        return cls(row[0], raw=row[1], columns=columns)
 
-    def __init__(self, id_: str, fields: dict) -> None:
+    def __init__(
+        self,
+        id_: str,
+        fields: Union[dict, None] = None,
+        created_time: OptionalString = None,
+        raw: OptionalString = None,
+        extra: Union[dict, None] = None,
+        columns: Union[ListAny, None] = None,
+    ) -> None:
         self.id_ = id_
-        self.fields = fields
-        [setattr(self, k, v) for k, v in self.fields.items()]
+        self.created_time = created_time
+        self.__raw = raw if fields is None else None
+        self.__fields = fields if fields is not None or raw is not None else {}
+        self.__extra = extra
+        self.__columns = frozenset(columns) if columns is not None else None
+
+    @property
+    def fields(self) -> dict:
+        """The record's fields, decoded on first use"""
+        if self.__fields is None:
+            fields = loads(self.__raw)
+            if self.__columns is not None:
+                fields = {k: v for k, v in fields.items() if k in self.__columns}
+            if self.__extra:
+                fields.update(self.__extra)
+            self.__fields = fields
+            self.__raw = None
+        return self.__fields
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called once normal lookup fails, so this is where the fields
+        # show up as attributes. Keep raising AttributeError for anything we
+        # don't have so hasattr() behaves like it always has.
+        if name.startswith("_"):
+            raise AttributeError(name)
 
-    def to_row(self) -> List[str]:
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def to_row(self) -> List[Any]:
         """Return a dbapi compatible row"""
-        return [self.id_, dumps(self.fields)]
+        if self.__raw is not None and self.__columns is None and not self.__extra:
+            return [self.id_, self.__raw, self.created_time]
+        return [self.id_, dumps(self.fields), self.created_time]
 
     def to_sheet(self, columns) -> List[str]:
-        return [utils.safe_list_convert(self.fields.get(c, "")) for c in columns]
+        fields = self.fields
+        return [utils.safe_list_convert(fields.get(c, "")) for c in columns]
 
 
 class Data:
@@ -60,66 +128,257 @@ class Data:
     could use something else.
     """
 
+    # The airtable tables we mirror into sqlite
+    __tables = (
+        "candidates",
+        "facilities",
+        "needs",
+        "candidate_tags",
+        "tracking",
+    )
+
+    # The fields our own queries read from each table. Projected fills only
+    # download these plus whatever extra fields the caller asks for.
+    __field_manifest = {
+        "candidates": (
+            "high_priority_health_care_practice",
+            "regional_availability",
+            "retirement_home_availability",
+            "hired",
+            "unavailable",
+        ),
+        "facilities": (
+            "facility_name",
+            "facility_type",
+            "contact_name",
+            "contact_email",
+            "approved",
+            "region",
+            "suppress_no_candidates_email",
+        ),
+        "needs": (
+            "facility",
+            "time_requested",
+            "needs_met",
+            "practice_area_1",
+            "practice_area_2",
+            "practice_area_3",
+        ),
+        "candidate_tags": ("authorized_facilities", "candidates"),
+        "tracking": ("facility", "candidates"),
+    }
+
+    # Airtable field names we already know, because we write to them or read
+    # them. Airtable leaves empty fields and unchecked checkboxes out of its
+    # responses, so a field like "Suppress No Candidates Email" may never show
+    # up in a full download. Names learned from a download take precedence, and
+    # if one of these is wrong Airtable rejects it and we download whole
+    # records (and learn the right one) instead.
+    __known_field_names = {
+        "candidates": {
+            "name": "Name",
+            "phone_number": "Phone Number",
+            "email_address": "Email Address",
+            "high_priority_health_care_practice": "High Priority Health Care Practice",
+            "additional_practice_areas": "Additional Practice Areas",
+            "regional_availability": "Regional Availability",
+            "practice_recency": "Practice Recency",
+            "license_status": "License Status",
+            "license_number": "License Number",
+            "out_of_state_license": "Out of State License",
+            "certifications": "Certifications",
+            "ft_v_pt": "FT v PT",
+            "workday_availability": "Workday Availability",
+            "available_on_weekdays": "Available on Weekdays",
+            "date_available": "Date Available",
+            "notes_about_availability": "Notes About Availability",
+            "covid_comfort": "COVID Comfort",
+            "critical_care_comfort": "Critical Care Comfort",
+            "retirement_home_availability": "Retirement Home Availability",
+            "telehealth_availability": "Telehealth Availability",
+            "mrc_member": "MRC Member",
+            "need_housing": "Need Housing",
+            "over_18": "Over 18",
+            "street_address": "Street Address",
+            "city": "City",
+            "zip_code": "Zip Code",
+            "state": "State",
+            "interest_and_ability": "Interest and Ability",
+            "hired": "Hired",
+            "unavailable": "Unavailable",
+        },
+        "facilities": {"suppress_no_candidates_email": "Suppress No Candidates Email"},
+        "tracking": {
+            "facility": "Facility",
+            "candidates": "Candidates",
+            "mailing_type": "Mailing Type",
+            "email_address": "Email Address",
+            "count": "Count",
+        },
+    }
+
+    # Airtable creates and updates at most this many records per request
+    __write_batch_size = 10
+
+    # How far back past the high-water mark an incremental sync reaches. This
+    # covers clock skew between us and Airtable and edits that were in flight
+    # while the previous sync ran.
+    __sync_overlap_seconds = 60
+
+    # How many rows we hold at once when streaming a whole table out of sqlite
+    # and into a worksheet
+    __stream_chunk_size = 1000
+
     def __init__(
         self,
         api_key: OptionalString = None,
         base_id: OptionalString = None,
         db_filepath: OptionalString = None,
+        incremental: Union[bool, None] = None,
+        rate_limiter: Union[RateLimiter, None] = None,
+        airtable_factory: Union[Callable[[str], Any], None] = None,
+        google_client: Union[Any, None] = None,
+        capture: OptionalString = None,
+        capture_dirpath: OptionalString = None,
+        profiler: Union[QueryProfiler, None] = None,
     ) -> None:
-        self.__api_key = api_key or config.airtable_api_key
-        self.__base_id = base_id or config.airtable_base_id
+        self.__api_key = api_key
+        self.__base_id = base_id
+
+        # Stand-ins for the Airtable and Google clients (see bench/). Given a
+        # table name, airtable_factory returns an object that quacks like an
+        # Airtable client for that table.
+        self.__airtable_factory = airtable_factory
+        self.__google_client = google_client
+
+        # "record" writes every page we read from Airtable to capture_dirpath,
+        # "replay" serves our reads from there instead of Airtable
+        self.capture = capture or config.airtable_capture
+        self.capture_dirpath = capture_dirpath or config.airtable_capture_dirpath
         self.db_filepath = db_filepath or ":memory:"
+        self.incremental = (
+            config.airtable_incremental_sync if incremental is None else incremental
+        )
+        self.rate_limiter = rate_limiter or RateLimiter(
+            config.airtable_requests_per_second,
+            burst=config.airtable_burst,
+            cooldown_seconds=config.airtable_throttle_cooldown_seconds,
+            max_retries=config.airtable_throttle_retries,
+        )
         self.__filled = False
 
+        # When set, every query we run is timed and has its plan recorded
+        if profiler is None and config.profile_queries:
+            profiler = QueryProfiler()
+        self.profiler = profiler
+
+        # Tasks may use us from a pool of worker threads, so access to our
+        # sqlite connection outside of fill() is serialized
+        self.__lock = RLock()
+
+        # Writes to Airtable waiting to go out in a batch
+        self.__writes_lock = RLock()
+        self.__pending_creates: List[Any] = []
+        self.__pending_updates: Dict[str, dict] = {}
+
+    def __airtable(self, table_name: str) -> Airtable:
+        if self.capture == "replay":
+            return ReplayAirtable(self.capture_dirpath, table_name)
+
+        if self.__airtable_factory:
+            api = self.__airtable_factory(table_name)
+        else:
+            api = Airtable(
+                self.__base_id or config.airtable_base_id,
+                table_name,
+                self.__api_key or config.airtable_api_key,
+            )
+            # We pace our requests with self.rate_limiter, which is shared
+            # across all of our tables, instead of the client's own sleep
+            api.API_LIMIT = 0
+
+        if self.capture == "record":
+            return RecordingAirtable(api, self.capture_dirpath, table_name)
+        return api
+
     @cached_property
     def candidates_api(self) -> Airtable:
-        return Airtable(
-            self.__base_id, config.airtable_candidates_table, self.__api_key
-        )
+        return self.__airtable(config.airtable_candidates_table)
 
     @cached_property
     def facilities_api(self) -> Airtable:
-        return Airtable(
-            self.__base_id, config.airtable_facilities_table, self.__api_key
-        )
+        return self.__airtable(config.airtable_facilities_table)
 
     @cached_property
     def needs_api(self) -> Airtable:
-        return Airtable(self.__base_id, config.airtable_needs_table, self.__api_key)
+        return self.__airtable(config.airtable_needs_table)
 
     @cached_property
     def config_api(self) -> Airtable:
-        return Airtable(self.__base_id, config.airtable_config_table, self.__api_key)
+        return self.__airtable(config.airtable_config_table)
 
     @cached_property
     def tracking_api(self) -> Airtable:
-        return Airtable(self.__base_id, config.airtable_tracking_table, self.__api_key)
+        return self.__airtable(config.airtable_tracking_table)
 
     @cached_property
     def candidate_tags_api(self) -> Airtable:
-        return Airtable(
-            self.__base_id, config.airtable_candidate_tags_table, self.__api_key
-        )
+        return self.__airtable(config.airtable_candidate_tags_table)
 
     @cached_property
     def google_client(self):
+        if self.__google_client is not None:
+            return self.__google_client
+
         return pygsheets.client.Client(
             Credentials.from_authorized_user_info(config.google_credentials)
         )
 
+    def __pages(self, api: Airtable, **kwargs) -> GenAny:
+        """Given an airtable api object, generate the raw pages of records in
+        the associated table. Every page request goes through our shared rate
+        limiter. We page through the table ourselves rather than with the
+        client's get_iter so that a throttled page can be retried from the
+        same offset.
+        """
+        offset = None
+        while True:
+            data = self.rate_limiter.call(
+                api._get, api.url_table, offset=offset, **kwargs
+            )
+            yield data.get("records", [])
+
+            offset = data.get("offset")
+            if not offset:
+                break
+
     def fetchall(self, api: Airtable, **kwargs) -> GenAny:
         """Given an airtable api object, generate all of the records in the
         associated table
         """
-        for page in api.get_iter(**kwargs):
+        for page in self.__pages(api, **kwargs):
             for record in page:
                 yield Model.from_airtable(record)
 
-    def list_facilities(self) -> ModelIterator:
-        """List all of the facilities"""
-        for facility in self.fetchall(self.facilities_api):
-            if hasattr(facility, "approved") and facility.approved:
-                yield facility
+    def list_facilities(self, from_airtable: bool = False) -> ModelIterator:
+        """List all of the approved facilities. These come from our local copy
+        of Airtable (filling it first if need be) unless from_airtable is set,
+        in which case we download the facilities table directly."""
+        if from_airtable:
+            for facility in self.fetchall(self.facilities_api):
+                if hasattr(facility, "approved") and facility.approved:
+                    yield facility
+            return  # Early Return
+
+        yield from self.__run_select_query(
+            """
+            SELECT id, fields
+              FROM facilities
+             WHERE json_extract(fields, '$.approved') >  0
+               AND json_extract(fields, '$.approved') <> ''
+            """,
+            [],
+        )
 
     @cached_property
     def config(self) -> dict:
@@ -164,14 +423,40 @@ class Data:
         self, facility: Any, value: bool
     ) -> None:
         """Given a facility object and a boolean value, update the "Suppress
-        No candidates Email" field in Airtable for that facility"""
-        self.facilities_api.update(
-            facility.id_, {"Suppress No Candidates Email": value}
-        )
+        No candidates Email" field in Airtable for that facility. The update is
+        buffered (see flush), and skipped entirely when our local copy of the
+        facility already has that value."""
+        with self.__lock:
+            row = self.__connection.execute(
+                """
+                SELECT json_extract(fields, "$.suppress_no_candidates_email")
+                  FROM facilities
+                 WHERE id = ?
+                """,
+                [facility.id_],
+            ).fetchone()
+
+            if row and bool(row[0]) == value:
+                return  # Early Return
+
+            with self.__connection:
+                self.__connection.execute(
+                    """
+                    UPDATE facilities
+                       SET fields = json_set(fields, "$.suppress_no_candidates_email", json(?))
+                     WHERE id = ?
+                    """,
+                    [dumps(value), facility.id_],
+                )
+
+        self.__buffer_update(facility.id_, {"Suppress No Candidates Email": value})
 
     def track(
         self, email_address: str, facility: Any, event_type: str, **kwargs
-    ) -> None:
+    ) -> bool:
+        """Add a record to the mailing tracking table. The record is buffered
+        and sent to Airtable in batches (see flush). Returns whether or not it
+        was accepted."""
         try:
             data = {
                 "Facility": [facility.id_],
@@ -179,11 +464,13 @@ class Data:
                 "Email Address": email_address,
             }
             data.update(kwargs)
-            self.tracking_api.insert(data)
+            self.__buffer_create(data, facility.facility_name)
         except Exception:
             logging.exception(
                 f"Failed adding tracking record to Airtable (facility: {facility.facility_name}; kwargs: {kwargs})"
             )
+            return False
+        return True
 
     def track_candidates(
         self, email_address: str, facility: Any, candidates: ListAny
@@ -201,123 +488,950 @@ class Data:
         except:
             pass
 
+    def __mark_previously_sent(
+        self, facility_id: str, candidate_ids: List[str]
+    ) -> None:
+        """Given a facility id and the ids of candidates we just sent them (if
+        any), keep our local previously sent indexes up to date without waiting
+        for the next fill"""
+        sent_at = self.__airtable_timestamp(datetime.now(timezone.utc))
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                """
+                INSERT INTO facility_sent VALUES (?, ?)
+                    ON CONFLICT ( facility_id )
+                    DO UPDATE SET last_sent_at = excluded.last_sent_at;
+                """,
+                [facility_id, sent_at],
+            )
+            self.__connection.executemany(
+                """
+                INSERT INTO previously_sent VALUES (?, ?, ?, ?)
+                    ON CONFLICT ( facility_id, candidate_id )
+                    DO UPDATE SET last_sent_at = excluded.last_sent_at;
+                """,
+                [[facility_id, c, sent_at, sent_at] for c in candidate_ids],
+            )
+
+    def __buffer_create(self, data: dict, label: str) -> None:
+        with self.__writes_lock:
+            self.__pending_creates.append((data, label))
+            if len(self.__pending_creates) < self.__write_batch_size:
+                return  # Early Return
+
+            creates = self.__pending_creates
+            self.__pending_creates = []
+
+        self.__send_creates(creates)
+
+    def __buffer_update(self, id_: str, fields: dict) -> None:
+        with self.__writes_lock:
+            self.__pending_updates.setdefault(id_, {}).update(fields)
+            if len(self.__pending_updates) < self.__write_batch_size:
+                return  # Early Return
+
+            updates = self.__pending_updates
+            self.__pending_updates = {}
+
+        self.__send_updates(updates)
+
+    def __send_creates(self, creates: List[Any]) -> None:
+        """Given a list of (fields, label) pairs, insert them into the tracking
+        table a batch at a time"""
+        for i in range(0, len(creates), self.__write_batch_size):
+            chunk = creates[i : i + self.__write_batch_size]
+
+            # The airtable client's batch_insert still makes a request per
+            # record, so we go to the batch endpoint ourselves
+            try:
+                with metrics.timer("airtable.creates"):
+                    self.rate_limiter.call(
+                        self.tracking_api._post,
+                        self.tracking_api.url_table,
+                        json_data={"records": [{"fields": data} for data, _ in chunk]},
+                    )
+            except Exception:
+                metrics.count("airtable.creates.failed", len(chunk))
+                logging.exception(
+                    f"Failed adding tracking records to Airtable (facilities: {[label for _, label in chunk]})"
+                )
+                continue  # Early Continuation
+
+            metrics.count("airtable.creates.records", len(chunk))
+
+            for data, _ in chunk:
+                try:
+                    self.__mark_previously_sent(
+                        data["Facility"][0], data.get("Candidates") or []
+                    )
+                except Exception:
+                    logging.exception(
+                        f"Failed updating the local previously sent index (facility: {data['Facility'][0]})"
+                    )
+
+    def __send_updates(self, updates: Dict[str, dict]) -> None:
+        """Given a dict of facility ids to fields, update those facilities a
+        batch at a time"""
+        records = [{"id": id_, "fields": fields} for id_, fields in updates.items()]
+        for i in range(0, len(records), self.__write_batch_size):
+            chunk = records[i : i + self.__write_batch_size]
+
+            try:
+                with metrics.timer("airtable.updates"):
+                    self.rate_limiter.call(
+                        self.facilities_api._patch,
+                        self.facilities_api.url_table,
+                        json_data={"records": chunk},
+                    )
+            except Exception:
+                metrics.count("airtable.updates.failed", len(chunk))
+                logging.exception(
+                    f"Failed updating facilities in Airtable (facilities: {[r['id'] for r in chunk]})"
+                )
+            else:
+                metrics.count("airtable.updates.records", len(chunk))
+
+    def flush(self) -> None:
+        """Send any buffered writes to Airtable. Tasks that track mailings or
+        update facilities must call this before they finish."""
+        with self.__writes_lock:
+            creates = self.__pending_creates
+            updates = self.__pending_updates
+            self.__pending_creates = []
+            self.__pending_updates = {}
+
+        self.__send_creates(creates)
+        self.__send_updates(updates)
+
     @cached_property
     def __connection(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.db_filepath)
+        return sqlite3.connect(self.db_filepath, check_same_thread=False)
 
     def __create_table_sql(self, table_name: str) -> str:
         return """
             CREATE TABLE IF NOT EXISTS {table_name} (
-                id     VARCHAR(63) PRIMARY KEY,
-                fields JSON        NOT NULL
+                id           VARCHAR(63) PRIMARY KEY,
+                fields       JSON        NOT NULL,
+                created_time TEXT
             );
         """.format(
             table_name=table_name
         )
 
     def __init_db(self) -> None:
-        for table in (
-            "candidates",
-            "facilities",
-            "needs",
-            "candidate_tags",
-            "tracking",
-        ):
-            with self.__connection:
+        with self.__connection:
+            for table in self.__tables:
                 self.__connection.execute(self.__create_table_sql(table))
 
+            self.__connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    table_name     VARCHAR(63) PRIMARY KEY,
+                    synced_at      TEXT        NOT NULL,
+                    full_synced_at TEXT        NOT NULL,
+                    fields         JSON        NOT NULL
+                );
+                """
+            )
+            # What we last wrote to each worksheet, so fill_sheets only has to
+            # send what changed
+            self.__connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sheet_state (
+                    sheet  VARCHAR(63) PRIMARY KEY,
+                    header JSON        NOT NULL,
+                    rows   INTEGER     NOT NULL
+                );
+                """
+            )
+            self.__connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sheet_rows (
+                    sheet VARCHAR(63) NOT NULL,
+                    id    VARCHAR(63) NOT NULL,
+                    row   INTEGER     NOT NULL,
+                    hash  CHAR(40)    NOT NULL,
+                    PRIMARY KEY ( sheet, id )
+                );
+                """
+            )
+            self.__connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS field_names (
+                    table_name VARCHAR(63)  NOT NULL,
+                    key        VARCHAR(255) NOT NULL,
+                    name       VARCHAR(255) NOT NULL,
+                    PRIMARY KEY ( table_name, key )
+                );
+                """
+            )
+            # Keep this expression in sync with list_facilities so that sqlite
+            # can use the index
+            self.__connection.execute(
+                """
+                CREATE INDEX IF NOT EXISTS facilities_approved
+                    ON facilities ( json_extract(fields, '$.approved') );
+                """
+            )
+
+            for create_sql, index_sql, _ in self.__matching_tables.values():
+                self.__connection.execute(create_sql)
+                self.__connection.execute(index_sql)
+
+            self.__connection.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS sync_seen (
+                    table_name VARCHAR(63) NOT NULL,
+                    id         VARCHAR(63) NOT NULL,
+                    PRIMARY KEY ( table_name, id )
+                );
+                """
+            )
+
+    # Normalized copies of the json lists our matching queries join on, rebuilt
+    # after every fill so that matching is a handful of indexed lookups rather
+    # than a json_each scan over whole tables for every facility. Text we
+    # match on is stored already trimmed and lowercased.
+    __matching_tables = {
+        "candidate_practice": (
+            """
+            CREATE TABLE IF NOT EXISTS candidate_practice (
+                candidate_id VARCHAR(63) NOT NULL,
+                practice     TEXT        NOT NULL
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS candidate_practice_practice
+                ON candidate_practice ( practice, candidate_id );
+            """,
+            """
+            INSERT INTO candidate_practice
+            SELECT DISTINCT c.id, trim(lower(p.value))
+              FROM candidates c, json_each(c.fields, "$.high_priority_health_care_practice") p
+             WHERE p.value is not null;
+            """,
+        ),
+        "candidate_region": (
+            """
+            CREATE TABLE IF NOT EXISTS candidate_region (
+                candidate_id VARCHAR(63) NOT NULL,
+                region       TEXT        NOT NULL
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS candidate_region_region
+                ON candidate_region ( region, candidate_id );
+            """,
+            """
+            INSERT INTO candidate_region
+            SELECT DISTINCT c.id, trim(lower(r.value))
+              FROM candidates c, json_each(c.fields, "$.regional_availability") r
+             WHERE r.value is not null;
+            """,
+        ),
+        "need_facility": (
+            """
+            CREATE TABLE IF NOT EXISTS need_facility (
+                need_id     VARCHAR(63) NOT NULL,
+                facility_id VARCHAR(63) NOT NULL,
+                latest      BOOLEAN     NOT NULL
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS need_facility_facility
+                ON need_facility ( facility_id, latest );
+            """,
+            """
+            INSERT INTO need_facility
+            SELECT n.id
+                 , f.value
+                 , row_number() over (
+                     partition by f.value
+                     order by datetime(json_extract(n.fields, "$.time_requested")) desc
+                   ) = 1
+              FROM needs n, json_each(n.fields, "$.facility") f;
+            """,
+        ),
+        "tracking_sent": (
+            """
+            CREATE TABLE IF NOT EXISTS tracking_sent (
+                tracking_id  VARCHAR(63) NOT NULL,
+                facility_id  VARCHAR(63) NOT NULL,
+                candidate_id VARCHAR(63) NOT NULL
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS tracking_sent_facility
+                ON tracking_sent ( facility_id, candidate_id );
+            """,
+            """
+            INSERT INTO tracking_sent
+            SELECT DISTINCT t.id, f.value, c.value
+              FROM tracking t
+                 , json_each(t.fields, "$.facility") f
+                 , json_each(t.fields, "$.candidates") c;
+            """,
+        ),
+        # Every candidate we've ever sent each facility, and when
+        "previously_sent": (
+            """
+            CREATE TABLE IF NOT EXISTS previously_sent (
+                facility_id   VARCHAR(63) NOT NULL,
+                candidate_id  VARCHAR(63) NOT NULL,
+                first_sent_at TEXT,
+                last_sent_at  TEXT,
+                PRIMARY KEY ( facility_id, candidate_id )
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS previously_sent_last_sent
+                ON previously_sent ( facility_id, last_sent_at );
+            """,
+            """
+            INSERT INTO previously_sent
+            SELECT s.facility_id
+                 , s.candidate_id
+                 , min(t.created_time)
+                 , max(t.created_time)
+              FROM tracking_sent s
+              JOIN tracking t
+                ON t.id = s.tracking_id
+             GROUP BY s.facility_id, s.candidate_id;
+            """,
+        ),
+        # The last time we sent each facility anything, candidates or not
+        "facility_sent": (
+            """
+            CREATE TABLE IF NOT EXISTS facility_sent (
+                facility_id  VARCHAR(63) NOT NULL,
+                last_sent_at TEXT
+            );
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS facility_sent_facility
+                ON facility_sent ( facility_id );
+            """,
+            """
+            INSERT INTO facility_sent
+            SELECT f.value, max(t.created_time)
+              FROM tracking t, json_each(t.fields, "$.facility") f
+             GROUP BY f.value;
+            """,
+        ),
+        "tag_facility": (
+            """
+            CREATE TABLE IF NOT EXISTS tag_facility (
+                tag_id       VARCHAR(63) NOT NULL,
+                facility_id  VARCHAR(63) NOT NULL,
+                candidate_id VARCHAR(63) NOT NULL
+            );
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS tag_facility_facility
+                ON tag_facility ( facility_id, candidate_id );
+            """,
+            """
+            INSERT INTO tag_facility
+            SELECT DISTINCT t.id, f.value, c.value
+              FROM candidate_tags t
+                 , json_each(t.fields, "$.authorized_facilities") f
+                 , json_each(t.fields, "$.candidates") c;
+            """,
+        ),
+    }
+
+    def __build_matching_tables(self) -> None:
+        """Rebuild the normalized tables our matching queries join on from the
+        records we just filled"""
+        with self.__connection:
+            for table_name, (_, _, insert_sql) in self.__matching_tables.items():
+                self.__connection.execute(f"DELETE FROM {table_name};")
+                self.__connection.execute(insert_sql)
+
     def __insert_record_sql(self, table_name: str) -> str:
         return """
-            INSERT OR REPLACE INTO {table_name} VALUES (?, ?);
+            INSERT OR REPLACE INTO {table_name} VALUES (?, ?, ?);
         """.format(
             table_name=table_name
         )
 
-    def __fill_table(self, table_name: str, batch_size: int = 1000) -> None:
-        """Given the name of a table and an optional batch size, fill our
-        local sqlite with the data in that airtable table
-        """
-        buffer = []
-        for count, model in enumerate(
-            self.fetchall(getattr(self, f"{table_name}_api"))
-        ):
-            buffer.append(model.to_row())
+    def __projection(
+        self, table_name: str, keys: Union[Iterable[str], None]
+    ) -> Union[List[str], None]:
+        """Given the name of a table and the model keys we need from it, return
+        the Airtable field names to request, or None to download whole records.
+        Airtable wants fields named exactly as they are in the base, so we
+        project on the names we know (from __known_field_names or an earlier
+        download). Until we've downloaded a table at least once, a key we
+        don't know means downloading whole records to learn its name. After
+        that, a key we've never seen belongs to a field no record has filled
+        in, so we leave it out rather than give up on projecting."""
+        if keys is None:
+            return None
+
+        learned = dict(
+            self.__connection.execute(
+                "SELECT key, name FROM field_names WHERE table_name = ?", [table_name],
+            ).fetchall()
+        )
+        names = {**self.__known_field_names.get(table_name, {}), **learned}
 
-            if not count % batch_size:
-                with self.__connection:
-                    self.__connection.executemany(
-                        self.__insert_record_sql(table_name), buffer
-                    )
+        missing = sorted(k for k in keys if k not in names)
+        if missing and not learned:
+            logging.info(
+                f"Downloading whole records until we've seen every field we need. (table: {table_name}; missing: {missing})"
+            )
+            return None
+
+        if missing:
+            logging.info(
+                f"Not requesting fields we've never seen. (table: {table_name}; missing: {missing})"
+            )
+
+        fields = sorted({names[k] for k in keys if k in names})
+        if not fields:
+            return None
+
+        return fields
+
+    def __changed_since(
+        self, table_name: str, started_at: datetime, fields: Union[List[str], None]
+    ) -> Union[datetime, None]:
+        """Given the name of a table, the time the current sync started, and the
+        fields we're about to request, return the high-water mark we should sync
+        that table from. Returns None when the table needs a full sync instead:
+        incremental syncs are turned off, we've never synced it, its local copy
+        holds a different set of fields, or its last full sync is too old to
+        trust that we haven't missed any deletions."""
+        if not self.incremental:
+            return None
+
+        row = self.__connection.execute(
+            """
+            SELECT synced_at, full_synced_at, fields
+              FROM sync_state
+             WHERE table_name = ?
+            """,
+            [table_name],
+        ).fetchone()
+
+        if not row or loads(row[2]) != fields:
+            return None
+
+        synced_at, full_synced_at = (datetime.fromisoformat(x) for x in row[:2])
+        age = (started_at - full_synced_at).total_seconds()
+        if age >= config.airtable_full_sync_interval_seconds:
+            return None
+
+        return synced_at
+
+    def __airtable_timestamp(self, value: datetime) -> str:
+        """Given a datetime, format it the way Airtable formats timestamps"""
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def __changed_since_formula(self, since: datetime) -> str:
+        """Given a high-water mark, return an Airtable formula matching the
+        records that were modified after it"""
+        since = since - timedelta(seconds=self.__sync_overlap_seconds)
+        timestamp = self.__airtable_timestamp(since)
+        return f'IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE("{timestamp}"))'
+
+    def __write_rows(self, table_name: str, rows: ListAny) -> None:
+        with self.__connection:
+            self.__connection.executemany(self.__insert_record_sql(table_name), rows)
+            self.__connection.executemany(
+                "INSERT OR IGNORE INTO sync_seen VALUES (?, ?);",
+                [[table_name, r[0]] for r in rows],
+            )
+
+    def __fetch_pages(
+        self,
+        table_name: str,
+        since: Union[datetime, None],
+        fields: Union[List[str], None],
+        rows: Queue,
+        batch_size: int,
+    ) -> None:
+        options: Dict[str, Any] = {}
+        if since:
+            options["formula"] = self.__changed_since_formula(since)
+        if fields is not None:
+            options["fields"] = fields
+
+        names: Dict[str, str] = {}
+        buffer = []
+        for page in self.__pages(getattr(self, f"{table_name}_api"), **options):
+            size = 0
+            for record in page:
+                row = Model.from_airtable(record).to_row()
+                buffer.append(row)
+                size += len(row[1])
+
+                # Remember what Airtable calls each field so later fills can
+                # ask for just the ones they need
+                if fields is None:
+                    for name in record["fields"]:
+                        if name not in names:
+                            names[name] = Model.fix_key(name)
+
+            metrics.count(f"fill.{table_name}.pages")
+            metrics.count(f"fill.{table_name}.records", len(page))
+            metrics.count(f"fill.{table_name}.bytes", size)
+
+            if len(buffer) >= batch_size:
+                rows.put((table_name, "rows", buffer))
                 buffer = []
 
         if len(buffer):
-            with self.__connection:
+            rows.put((table_name, "rows", buffer))
+
+        if fields is None:
+            rows.put((table_name, "names", {k: n for n, k in names.items()}))
+
+    def __fetch_table(
+        self,
+        table_name: str,
+        since: Union[datetime, None],
+        fields: Union[List[str], None],
+        rows: Queue,
+        batch_size: int = 1000,
+    ) -> None:
+        """Given the name of a table, an optional high-water mark, an optional
+        list of fields, a queue, and an optional batch size, pull that table
+        from airtable and put batches of rows on the queue for the writer.
+        Finishes with a "done" message carrying the high-water mark and fields
+        we actually used, or an "error" message if the download failed."""
+        try:
+            try:
+                with metrics.timer(f"fill.{table_name}"):
+                    self.__fetch_pages(table_name, since, fields, rows, batch_size)
+            except HTTPError as e:
+                # Airtable rejects the whole request (before sending any
+                # records) when a field we ask for was renamed or removed
+                if fields is None or not str(e).startswith("422"):
+                    raise e
+
+                logging.warning(
+                    f"Airtable rejected our field list. Downloading whole records instead. (table: {table_name}; error: {e})"
+                )
+                since, fields = None, None
+                with metrics.timer(f"fill.{table_name}"):
+                    self.__fetch_pages(table_name, since, fields, rows, batch_size)
+        except Exception as e:
+            rows.put((table_name, "error", e))
+        else:
+            rows.put((table_name, "done", (since, fields)))
+
+    def __finish_table(
+        self,
+        table_name: str,
+        started_at: datetime,
+        since: Union[datetime, None],
+        fields: Union[List[str], None],
+        names: Union[Dict[str, str], None],
+        count: int,
+    ) -> None:
+        """Given the name of a table we just pulled, the time the current sync
+        started, the high-water mark and fields we pulled it with, the field
+        names we saw (if we pulled whole records), and how many records came
+        back, record the sync. Full syncs also drop any local records that no
+        longer exist in Airtable."""
+        with self.__connection:
+            if since:
+                self.__connection.execute(
+                    "UPDATE sync_state SET synced_at = ? WHERE table_name = ?",
+                    [started_at.isoformat(), table_name],
+                )
+            else:
+                self.__connection.execute(
+                    f"""
+                    DELETE FROM {table_name}
+                     WHERE id NOT IN (SELECT id FROM sync_seen WHERE table_name = ?);
+                    """,
+                    [table_name],
+                )
+                self.__connection.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?);",
+                    [
+                        table_name,
+                        started_at.isoformat(),
+                        started_at.isoformat(),
+                        dumps(fields),
+                    ],
+                )
+
+            if names is not None:
+                if not since:
+                    self.__connection.execute(
+                        "DELETE FROM field_names WHERE table_name = ?", [table_name]
+                    )
                 self.__connection.executemany(
-                    self.__insert_record_sql(table_name), buffer
+                    "INSERT OR REPLACE INTO field_names VALUES (?, ?, ?);",
+                    [[table_name, k, n] for k, n in names.items()],
                 )
 
-    def fill(self) -> None:
+        logging.info(
+            f"Synced table from Airtable. (table: {table_name}; mode: {'incremental' if since else 'full'}; projected: {fields is not None}; records: {count})"
+        )
+
+    def fill(self, fields: Union[Dict[str, Iterable[str]], None] = None) -> None:
         """Fill a sqlite database with all of the data we need to generate matches
-        in airtable
+        in airtable. When incremental syncs are turned on, tables we've synced
+        before only pull the records that changed since, with a periodic full
+        sync to catch deletions.
+
+        Given a mapping of table names to the extra model keys a task needs, we
+        only download the fields our queries use plus those. Without one we
+        download whole records, which is what anything exporting entire tables
+        (like the google sheets) needs.
+
+        Tables are downloaded concurrently, sharing one rate limiter, while this
+        thread is the only one that writes to sqlite.
         """
         self.__init_db()
 
-        for table_name in (
-            "candidates",
-            "facilities",
-            "needs",
-            "candidate_tags",
-            "tracking",
-        ):
-            self.__fill_table(table_name)
+        with self.__connection:
+            self.__connection.execute("DELETE FROM sync_seen;")
+
+        started_at = datetime.now(timezone.utc)
+        projections = {
+            t: self.__projection(
+                t,
+                None
+                if fields is None
+                else {*self.__field_manifest[t], *fields.get(t, ())},
+            )
+            for t in self.__tables
+        }
+        since = {
+            t: self.__changed_since(t, started_at, projections[t])
+            for t in self.__tables
+        }
+        counts = {t: 0 for t in self.__tables}
+        names: Dict[str, Any] = {t: None for t in self.__tables}
+        errors = []
+        rows: Queue = Queue()
+
+        with ThreadPoolExecutor(max_workers=config.airtable_fill_workers) as pool:
+            for table_name in self.__tables:
+                pool.submit(
+                    self.__fetch_table,
+                    table_name,
+                    since[table_name],
+                    projections[table_name],
+                    rows,
+                )
+
+            pending = len(self.__tables)
+            while pending:
+                table_name, kind, message = rows.get()
+
+                if kind == "rows":
+                    with metrics.timer("fill.writes"):
+                        self.__write_rows(table_name, message)
+                    counts[table_name] += len(message)
+                elif kind == "names":
+                    names[table_name] = message
+                elif kind == "error":
+                    pending -= 1
+                    logging.error(
+                        f"Failed syncing table from Airtable. (table: {table_name}; error: {message})"
+                    )
+                    errors.append(message)
+                else:
+                    pending -= 1
+                    self.__finish_table(
+                        table_name,
+                        started_at,
+                        *message,
+                        names[table_name],
+                        counts[table_name],
+                    )
+
+        if errors:
+            raise errors[0]
+
+        with metrics.timer("fill.matching_tables"):
+            self.__build_matching_tables()
         self.__filled = True
 
-    def __run_select_query(
-        self, sql: str, args: List[Any], for_lists: bool = False
-    ) -> ModelIterator:
+    @property
+    def filled(self) -> bool:
+        """Have we filled the local database during this process?"""
+        return self.__filled
+
+    def load_snapshot(self, filepath: str, filled: bool = False) -> bool:
+        """Given the path to a database saved with save_snapshot, copy it into
+        our local database. The next fill picks up from the sync state stored
+        in the snapshot. Given filled, we treat the snapshot as our data and
+        don't fill on top of it before querying. Returns whether or not we
+        loaded anything."""
+        if not os.path.exists(filepath):
+            return False
+
+        try:
+            source = sqlite3.connect(filepath)
+            try:
+                source.backup(self.__connection)
+            finally:
+                source.close()
+        except sqlite3.Error:
+            logging.exception(
+                f"Failed loading database snapshot. (filepath: {filepath})"
+            )
+            return False
+
+        # Snapshots saved by an older version may be missing newer tables
+        self.__init_db()
+
+        if filled:
+            self.__filled = True
+
+        logging.info(f"Loaded database snapshot. (filepath: {filepath})")
+        return True
+
+    def save_snapshot(self, filepath: str) -> None:
+        """Given a path, save a copy of our local database (along with its sync
+        state) there"""
+        utils.mkdirp(os.path.dirname(filepath) or ".")
+
+        # Write next to the destination and swap it in so that nobody ever
+        # loads a half written snapshot
+        partial_filepath = f"{filepath}.partial"
+        destination = sqlite3.connect(partial_filepath)
+        try:
+            self.__connection.backup(destination)
+        finally:
+            destination.close()
+        os.replace(partial_filepath, filepath)
+
+        logging.info(f"Saved database snapshot. (filepath: {filepath})")
+
+    def __run_query(
+        self, sql: str, args: List[Any], name: OptionalString = None
+    ) -> GenAny:
         if not self.__filled:
             self.fill()
 
-        with self.__connection:
-            cursor = self.__connection.cursor()
-            cursor.execute(sql, args)
-            for row in cursor.fetchall():
-                yield Model.from_row(row, for_lists=for_lists)
+        with self.__lock, self.__connection:
+            if self.profiler:
+                rows = self.profiler.run(self.__connection, sql, args, name)
+            else:
+                rows = self.__connection.execute(sql, args).fetchall()
 
-    def select_all(self, name):
-        return self.__run_select_query(f"""SELECT * FROM {name};""", [])
+        for row in rows:
+            yield row
+
+    def __stream_query(self, sql: str, args: List[Any]) -> GenAny:
+        """Like __run_query, but only holds __stream_chunk_size rows at a time.
+        The lock is released between chunks, so don't use this for queries
+        that need to see a consistent table while other threads write to it."""
+        if not self.__filled:
+            self.fill()
+
+        cursor = self.__connection.cursor()
+        try:
+            with self.__lock:
+                rows = cursor.execute(sql, args).fetchmany(self.__stream_chunk_size)
+
+            while rows:
+                yield from rows
+                with self.__lock:
+                    rows = cursor.fetchmany(self.__stream_chunk_size)
+        finally:
+            cursor.close()
+
+    def __run_select_query(
+        self,
+        sql: str,
+        args: List[Any],
+        for_lists: bool = False,
+        columns: Union[ListAny, None] = None,
+        name: OptionalString = None,
+    ) -> ModelIterator:
+        for row in self.__run_query(sql, args, name):
+            yield Model.from_row(row, for_lists=for_lists, columns=columns)
+
+    def select_all(
+        self, name: str, columns: Union[ListAny, None] = None
+    ) -> ModelIterator:
+        """Return every record in a table. Given columns, the records only
+        expose those fields. Rows are read __stream_chunk_size at a time, so
+        exporting a whole table never holds all of it in memory."""
+        for row in self.__stream_query(f"""SELECT * FROM {name};""", []):
+            yield Model.from_row(row, columns=columns)
+
+    # Facilities whose most recent staffing request hasn't been met yet, along
+    # with that request
+    __facilities_in_need_sql = """
+        SELECT f.id
+             , f.fields
+             , n.fields as need_fields
+
+          FROM facilities f
+
+          JOIN need_facility nf
+            ON nf.facility_id = f.id
+           AND nf.latest      = 1
+
+          JOIN needs n
+            ON n.id = nf.need_id
+
+         WHERE json_extract(n.fields, "$.needs_met") is null
+            OR json_extract(n.fields, "$.needs_met") = "No"
+    """
 
     def facilities_in_need(self) -> ModelIterator:
-        sql = """
-            WITH needs_extrapolated AS (
+        """Return the facilities whose most recent staffing request hasn't been
+        met yet"""
+        return self.__run_select_query(
+            self.__facilities_in_need_sql, [], name="facilities_in_need"
+        )
 
-               SELECT n.*
-                    , json_each.value as facility_id
-                    , row_number() over (
-                        partition by json_each.value
-                        order by datetime(json_extract(n.fields, "$.time_requested")) desc
-                      ) rn
+    def facilities_in_need_by_priority(self) -> ModelIterator:
+        """Return the facilities whose most recent staffing request hasn't been
+        met yet, the ones we've never sent anything to first and then the ones
+        whose request is most recent"""
+        sql = f"""
+            WITH facilities_in_need AS (
 
-                 FROM needs n, json_each(n.fields, "$.facility")
+               {self.__facilities_in_need_sql}
+
+            )
+            SELECT f.id
+                 , f.fields
+
+              FROM facilities_in_need f
+
+              LEFT JOIN facility_sent s
+                ON s.facility_id = f.id
+
+             ORDER BY s.last_sent_at is not null
+                    , datetime(json_extract(f.need_fields, "$.time_requested")) desc
+                    , f.id
+        """
+        return self.__run_select_query(sql, [], name="facilities_in_need_by_priority")
+
+    def candidates_for_facilities_in_need(self) -> Dict[str, ListAny]:
+        """Find the candidates for every facility in need in a single pass,
+        applying the same rules as candidates_for_facility. Returns a dict
+        mapping facility ids to lists of candidate models. Facilities without
+        any matches are left out."""
+        sql = f"""
+            WITH facilities_in_need AS (
+
+               {self.__facilities_in_need_sql}
 
             ), facility_needs AS (
 
-               SELECT f.id as id
-                    , json_extract(n.fields, "$.needs_met") as needs_met
+               SELECT id as facility_id
+                    , need_fields
+                    , coalesce(
+                          json_array_length(fields, "$.facility_type") = 1
+                      AND json_extract(fields, "$.facility_type[0]") = "Nursing Home"
+                      , 0
+                      ) as is_nursing_home
+
+                 FROM facilities_in_need
+
+                WHERE json_extract(need_fields, "$.practice_area_1") is not null
+
+            ), facility_practices AS (
+
+               SELECT facility_id
+                    , is_nursing_home
+                    , trim(lower(json_extract(need_fields, "$.practice_area_1"))) as practice
+                 FROM facility_needs
+                UNION
+               SELECT facility_id
+                    , is_nursing_home
+                    , trim(lower(json_extract(need_fields, "$.practice_area_2")))
+                 FROM facility_needs
+                UNION
+               SELECT facility_id
+                    , is_nursing_home
+                    , trim(lower(json_extract(need_fields, "$.practice_area_3")))
+                 FROM facility_needs
 
-                 FROM facilities f
+            ), facility_regions AS (
 
-                 JOIN needs_extrapolated n
-                   ON f.id = n.facility_id
-                  AND rn   = 1
+               SELECT DISTINCT
+                      f.id as facility_id
+                    , trim(lower(r.value)) as region
+                 FROM facilities_in_need f, json_each(f.fields, "$.region") r
+
+            ), needed_candidate_ids AS (
+
+               -- CROSS JOIN pins the join order so we always start from the
+               -- facilities' practice areas and regions
+               SELECT DISTINCT
+                      fp.facility_id
+                    , c.id as candidate_id
+
+                 FROM facility_practices fp
+
+                CROSS JOIN candidate_practice cp
+                   ON cp.practice = fp.practice
+
+                CROSS JOIN facility_regions fr
+                   ON fr.facility_id = fp.facility_id
+
+                CROSS JOIN candidate_region cr
+                   ON cr.region       = fr.region
+                  AND cr.candidate_id = cp.candidate_id
+
+                CROSS JOIN candidates c
+                   ON c.id = cp.candidate_id
+
+                WHERE json_extract(c.fields, "$.hired")       is null
+                  AND json_extract(c.fields, "$.unavailable") is null
+                  AND (    NOT fp.is_nursing_home
+                        OR json_extract(c.fields, "$.retirement_home_availability") = "Yes" )
+
+            ), tagged_candidate_ids AS (
+
+               SELECT f.id as facility_id
+                    , t.candidate_id
+
+                 FROM facilities_in_need f
+
+                CROSS JOIN tag_facility t
+                   ON t.facility_id = f.id
+
+            ), matched_candidate_ids AS (
+
+               SELECT facility_id, candidate_id FROM needed_candidate_ids
+                UNION
+               SELECT facility_id, candidate_id FROM tagged_candidate_ids
             )
-            SELECT *
-              FROM facilities f
-              JOIN facility_needs n USING ( id )
-             WHERE needs_met is null
-                OR needs_met  = "No"
-            """
-        return self.__run_select_query(sql, [])
+            SELECT c.id
+                 , c.fields
+                 , CASE WHEN EXISTS (
+                       SELECT 1
+                         FROM previously_sent p
+                        WHERE p.facility_id  = m.facility_id
+                          AND p.candidate_id = c.id
+                   ) THEN "Yes" ELSE "No" END previouslySentGroup
+                 , m.facility_id
+
+              FROM matched_candidate_ids m
+
+              JOIN candidates c
+                ON c.id = m.candidate_id
+            ;
+        """
+        matches: Dict[str, ListAny] = {}
+        with metrics.timer("matching"):
+            for row in self.__run_query(
+                sql, [], name="candidates_for_facilities_in_need"
+            ):
+                matches.setdefault(row[3], []).append(
+                    Model.from_row(row, for_lists=True)
+                )
+
+        metrics.count("matching.facilities", len(matches))
+        metrics.count("matching.candidates", sum(len(m) for m in matches.values()))
+        return matches
 
     def candidates_for_facility(self, facility: Any) -> ModelIterator:
         """Given the name of a facility, find all the candidates that match
@@ -352,121 +1466,279 @@ class Data:
             clause = """AND json_extract(c.fields, "$.retirement_home_availability") = "Yes" """
 
         sql = f"""
-            WITH needs_extrapolated AS (
+            WITH latest_need AS (
 
-               SELECT n.*
-                    , json_each.value as facility_id
-                    , row_number() over (
-                        partition by json_each.value
-                        order by datetime(json_extract(n.fields, "$.time_requested")) desc
-                      ) rn
+               SELECT n.fields
 
-                 FROM needs n, json_each(n.fields, "$.facility")
+                 FROM need_facility nf
 
-            ), facility_needs AS (
+                 JOIN needs n
+                   ON n.id = nf.need_id
 
-               SELECT json_extract(n.fields, "$.practice_area_1") as practice_area_1
-                    , json_extract(n.fields, "$.practice_area_2") as practice_area_2
-                    , json_extract(n.fields, "$.practice_area_3") as practice_area_3
-                    , r.value as region
+                WHERE nf.facility_id = ?
+                  AND nf.latest      = 1
+                  AND json_extract(n.fields, "$.practice_area_1") is not null
 
-                 FROM facilities f, json_each(f.fields, "$.region") r
+            ), facility_practices AS (
 
-                 JOIN needs_extrapolated n
-                   ON f.id = n.facility_id
+               SELECT trim(lower(json_extract(fields, "$.practice_area_1"))) as practice
+                 FROM latest_need
+                UNION
+               SELECT trim(lower(json_extract(fields, "$.practice_area_2")))
+                 FROM latest_need
+                UNION
+               SELECT trim(lower(json_extract(fields, "$.practice_area_3")))
+                 FROM latest_need
 
+            ), facility_regions AS (
+
+               SELECT DISTINCT trim(lower(r.value)) as region
+                 FROM facilities f, json_each(f.fields, "$.region") r
                 WHERE f.id = ?
-                  AND practice_area_1 is not null
-                  AND rn = 1
 
-            ), previously_sent_candidate_ids AS (
+            ), needed_candidate_ids AS (
 
-               SELECT candidate_ids.value as c_id
+               -- CROSS JOIN pins the join order so we always start from the
+               -- facility's handful of practice areas and regions
+               SELECT DISTINCT c.id
 
-                 FROM tracking t
-                    , json_each(t.fields, '$.facility' ) facility_id
-                    , json_each(t.fields, '$.candidates' ) candidate_ids
+                 FROM facility_practices fp
 
-                 JOIN facilities f
-                   ON facility_id.value = f.id
-                  AND f.id = ?
+                CROSS JOIN candidate_practice cp
+                   ON cp.practice = fp.practice
 
-            ), needed_candidate_ids AS  (
+                CROSS JOIN facility_regions fr
 
-               SELECT DISTINCT
-                      c.id,
-                      CASE p.c_id WHEN null THEN "No" ELSE "Yes" END previouslySentGroup
+                CROSS JOIN candidate_region cr
+                   ON cr.region       = fr.region
+                  AND cr.candidate_id = cp.candidate_id
 
-                 FROM candidates c
-                    , json_each(c.fields, "$.high_priority_health_care_practice") p
-                    , json_each(c.fields, "$.regional_availability") r
-
-                 JOIN facility_needs f
-                   ON trim(lower(r.value)) = trim(lower(f.region))
-                  AND (    trim(lower(p.value)) = trim(lower(f.practice_area_1))
-                        OR trim(lower(p.value)) = trim(lower(f.practice_area_2))
-                        OR trim(lower(p.value)) = trim(lower(f.practice_area_3)) )
-                LEFT JOIN previously_sent_candidate_ids p
-                  ON p.c_id = c.id
+                CROSS JOIN candidates c
+                   ON c.id = cp.candidate_id
 
                 WHERE json_extract(c.fields, "$.hired")       is null
                   AND json_extract(c.fields, "$.unavailable") is null
                       {clause}
 
-            ), tagged_candidate_ids as (
-
-               SELECT DISTINCT
-                      c.value as id
-                      , CASE p.c_id WHEN null THEN "No" ELSE "Yes" END previouslySentGroup
-
-                 FROM candidate_tags t
-                    , json_each(t.fields, "$.authorized_facilities") f
-                    , json_each(t.fields, "$.candidates") c
-                 LEFT JOIN previously_sent_candidate_ids p
-                   ON p.c_id = c.value
+            ), tagged_candidate_ids AS (
 
-                WHERE f.value = ?
-            )
-            SELECT distinct c.id, c.fields, previouslySentGroup
-
-              FROM candidates c
+               SELECT candidate_id as id
+                 FROM tag_facility
+                WHERE facility_id = ?
 
-              JOIN needed_candidate_ids USING (id)
+            ), matched_candidate_ids AS (
 
+               SELECT id FROM needed_candidate_ids
                 UNION
-
-            SELECT distinct c.id, c.fields, previouslySentGroup
-
-              FROM candidates C
-
-              JOIN tagged_candidate_ids USING (id)
+               SELECT id FROM tagged_candidate_ids
+            )
+            SELECT c.id
+                 , c.fields
+                 , CASE WHEN EXISTS (
+                       SELECT 1
+                         FROM previously_sent p
+                        WHERE p.facility_id  = ?
+                          AND p.candidate_id = c.id
+                   ) THEN "Yes" ELSE "No" END previouslySentGroup
+
+              FROM matched_candidate_ids
+
+              JOIN candidates c USING ( id )
             ;
         """
         return self.__run_select_query(
-            sql, [facility.id_, facility.id_, facility.id_], for_lists=True
+            sql, [facility.id_] * 4, for_lists=True, name="candidates_for_facility"
         )
 
-    def __get_sheet(self):
-        return self.google_client.open_by_key(config.google_spreadsheet_id)
+    def __queue_runs(
+        self, batch: SheetsBatch, worksheet: Any, updates: List[Tuple[int, ListAny]]
+    ) -> None:
+        """Given (row number, values) pairs, queue them on a batch, merging runs
+        of consecutive rows into a single range"""
+        run: ListAny = []
+        start = 0
+        for row, values in sorted(updates, key=lambda u: u[0]):
+            if run and row != start + len(run):
+                batch.add(worksheet, start, run)
+                run = []
+
+            if not run:
+                start = row
+            run.append(values)
+
+        batch.add(worksheet, start, run)
+
+    def __determine_header(self, name: str) -> List[str]:
+        """Given a table, return every field key used by any of its records"""
+        rows = self.__run_query(
+            f"""
+            SELECT DISTINCT j.key
+              FROM {name} t, json_each(t.fields) j
+             ORDER BY j.key;
+            """,
+            [],
+        )
+        return [row[0] for row in rows]
 
-    def __get_worksheet(self, name):
-        return self.__get_sheet().worksheet_by_title(
-            getattr(config, f"google_{name}_sheet_name")
+    def __fingerprint(self, values: ListAny) -> str:
+        return sha1(dumps(values, default=str).encode("utf-8")).hexdigest()
+
+    def __sheet_state(self, name: str) -> Union[Tuple[List[str], int], None]:
+        """Given a table, return the header and number of rows we last wrote to
+        its worksheet, if we know them"""
+        rows = list(
+            self.__run_query(
+                "SELECT header, rows FROM sheet_state WHERE sheet = ?;", [name]
+            )
         )
+        return (loads(rows[0][0]), rows[0][1]) if rows else None
+
+    def __save_sheet_state(
+        self,
+        name: str,
+        header: List[str],
+        used_rows: int,
+        fingerprints: List[Tuple[str, str, int, str]],
+        removed: List[str],
+    ) -> None:
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO sheet_state VALUES (?, ?, ?);",
+                [name, dumps(header), used_rows],
+            )
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO sheet_rows VALUES (?, ?, ?, ?);", fingerprints,
+            )
+            self.__connection.executemany(
+                "DELETE FROM sheet_rows WHERE sheet = ? AND id = ?;",
+                [[name, id_] for id_ in removed],
+            )
 
-    def __write_sheet(self, name, data):
-        worksheet = self.__get_worksheet(name)
-        worksheet.update_values(crange="A1", values=data, extend=True)
+    def __forget_sheet(self, name: str) -> None:
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                "DELETE FROM sheet_state WHERE sheet = ?;", [name]
+            )
+            self.__connection.execute("DELETE FROM sheet_rows WHERE sheet = ?;", [name])
+
+    def __rewrite_sheet(
+        self, batch: SheetsBatch, worksheet: Any, name: str, header: List[str]
+    ) -> SheetState:
+        """Given a table and its header, queue writing every record to its
+        (already cleared) worksheet. Returns the state to save once the batch
+        has been sent."""
+        fingerprints = []
+        chunk, start = [header], 1
+        for number, record in enumerate(self.select_all(name), start=2):
+            values = record.to_sheet(header)
+            fingerprints.append((name, record.id_, number, self.__fingerprint(values)))
+            chunk.append(values)
+
+            if len(chunk) >= self.__stream_chunk_size:
+                batch.add(worksheet, start, chunk)
+                start += len(chunk)
+                chunk = []
+
+        batch.add(worksheet, start, chunk)
+
+        logging.info(
+            f"Rewriting worksheet. (sheet: {name}; records: {len(fingerprints)})"
+        )
+        return name, header, len(fingerprints) + 1, fingerprints, []
 
-    def __determine_header(self, results: ListAny) -> List[str]:
-        keys = set()
-        for r in results:
-            [keys.add(k) for k in r.fields.keys()]
-        return list(sorted(list(keys)))
+    def __update_sheet(
+        self,
+        batch: SheetsBatch,
+        worksheet: Any,
+        name: str,
+        header: List[str],
+        used_rows: int,
+    ) -> SheetState:
+        """Given a table, its header, and how many rows its worksheet has, queue
+        writing only the records that changed since the last run. Returns the
+        state to save once the batch has been sent."""
+        with self.__lock:
+            known = {
+                id_: (row, fingerprint)
+                for id_, row, fingerprint in self.__connection.execute(
+                    "SELECT id, row, hash FROM sheet_rows WHERE sheet = ?;", [name]
+                )
+            }
 
-    def fill_sheets(self):
+        updates, added, fingerprints = [], [], []
+        for record in self.select_all(name):
+            values = record.to_sheet(header)
+            fingerprint = self.__fingerprint(values)
+            row, previous = known.pop(record.id_, (None, None))
+
+            if row is None:
+                added.append((record.id_, values, fingerprint))
+            elif fingerprint != previous:
+                updates.append((row, values))
+                fingerprints.append((name, record.id_, row, fingerprint))
+
+        changed = len(updates)
+
+        # Whatever is left in known was removed from the table. New records
+        # take over those rows before we grow the sheet, and any rows nobody
+        # takes over get blanked.
+        free = sorted((row for row, _ in known.values()), reverse=True)
+        for id_, values, fingerprint in added:
+            if free:
+                row = free.pop()
+            else:
+                used_rows += 1
+                row = used_rows
+            updates.append((row, values))
+            fingerprints.append((name, id_, row, fingerprint))
+
+        updates.extend((row, [""] * len(header)) for row in free)
+        self.__queue_runs(batch, worksheet, updates)
+
+        logging.info(
+            "Updating worksheet. "
+            f"(sheet: {name}; changed: {changed}; added: {len(added)}; removed: {len(known)})"
+        )
+        return name, header, used_rows, fingerprints, list(known)
+
+    def fill_sheets(self, full: bool = False) -> None:
+        """Bring our google sheets up to date with our local database. We
+        remember a fingerprint of every row we write, so unless asked for a
+        full rewrite (or the columns changed) only rows that changed, were
+        added, or were removed since the last run get sent to Google. All four
+        worksheets go out together in as few requests as Google allows."""
+        spreadsheet = self.google_client.open_by_key(config.google_spreadsheet_id)
+        batch = SheetsBatch(self.google_client, spreadsheet)
+
+        plans = []
         for name in ("candidates", "facilities", "tracking", "needs"):
-            results = list(self.select_all(name))
-            header = self.__determine_header(results)
-            data = [header] + [r.to_sheet(header) for r in results]
-            self.__write_sheet(name, data)
+            worksheet = spreadsheet.worksheet_by_title(
+                getattr(config, f"google_{name}_sheet_name")
+            )
+            header = self.__determine_header(name)
+            state = self.__sheet_state(name)
+            rewrite = full or state is None or state[0] != header
+            plans.append((name, worksheet, header, None if rewrite else state[1]))
+
+        # Forget what we knew about the worksheets we rewrite before touching
+        # them, so that a rewrite that fails half way is retried in full next
+        # time instead of diffed against a stale sheet
+        rewrites = [plan for plan in plans if plan[3] is None]
+        for name, *_ in rewrites:
+            self.__forget_sheet(name)
+        batch.clear(worksheet for _, worksheet, *_ in rewrites)
+
+        states = []
+        for name, worksheet, header, used_rows in plans:
+            if used_rows is None:
+                states.append(self.__rewrite_sheet(batch, worksheet, name, header))
+            else:
+                states.append(
+                    self.__update_sheet(batch, worksheet, name, header, used_rows)
+                )
+
+        batch.flush()
+        for state in states:
+            self.__save_sheet_state(*state)
+
+        logging.info(f"Updated google sheets. (requests: {batch.requests})")
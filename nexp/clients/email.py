@@ -1,36 +1,47 @@
 # nexp.clients.email
 
+from typing import List, Set, Tuple, Union
+from json import loads
 import logging
-from typing import Union
+import re
+import time
 
 from sendgrid import SendGridAPIClient
 
 from nexp.aliases import OptionalString
 from nexp.config import config
+from nexp.metrics import metrics
 
 
 class Email:
+    # Sendgrid takes at most this many personalizations per mail/send request
+    __max_personalizations = 1000
+
+    # How many times, and starting how many seconds apart, we retry a request
+    # Sendgrid throttled
+    __throttle_retries = 3
+    __throttle_backoff_seconds = 2.0
+
     def __init__(self, client: Union[SendGridAPIClient, None] = None) -> None:
         self.__client = client or SendGridAPIClient(config.sendgrid_api_key)
 
-    def send_transactional_template(
+    def __personalization(self, to_email: str, template_data: dict) -> dict:
+        # why would yapf do this?...
+        if config.override_email_destination:
+            to_email = str(config.override_email_destination)
+
+        return {"to": [{"email": to_email}], "dynamic_template_data": template_data}
+
+    def __send(
         self,
-        to_email: str,
+        personalizations: List[dict],
         from_email: str,
         template_id: str,
         asm_group_id: str,
-        template_data: dict,
         reply_to: OptionalString = None,
     ) -> None:
-        """Send a transaction templated email"""
-        # why would yapf do this?...
-        if config.override_email_destination:
-            to_email = str(config.override_email_destination)
-
         data = {
-            "personalizations": [
-                {"to": [{"email": to_email}], "dynamic_template_data": template_data}
-            ],
+            "personalizations": personalizations,
             "from": {"email": from_email,},
             "reply_to": {"email": reply_to or from_email,},
             "asm": {"group_id": int(asm_group_id)},
@@ -38,16 +49,139 @@ class Email:
         }
 
         try:
-            response = self.__client.client.mail.send.post(request_body=data)
+            with metrics.timer("email.send"):
+                response = self.__client.client.mail.send.post(request_body=data)
             assert 200 <= response.status_code < 300
         except Exception as e:
+            metrics.count("email.failed", len(personalizations))
             if (
                 hasattr(e, "status_code")
                 and hasattr(e, "body")
                 and hasattr(e, "headers")
             ):
-                logging.exception(f"Failed sending email. (status_code: {e.status_code}; body: {e.body})")  # type: ignore
-                print(e.status_code)  # type: ignore
-                print(e.body)  # type: ignore
-                print(e.headers)  # type: ignore
+                logging.exception(f"Failed sending email. (status_code: {e.status_code}; body: {e.body}; headers: {e.headers})")  # type: ignore
             raise e
+
+        metrics.count("email.sent", len(personalizations))
+
+    def send_transactional_template(
+        self,
+        to_email: str,
+        from_email: str,
+        template_id: str,
+        asm_group_id: str,
+        template_data: dict,
+        reply_to: OptionalString = None,
+    ) -> None:
+        """Send a transaction templated email"""
+        self.__send(
+            [self.__personalization(to_email, template_data)],
+            from_email,
+            template_id,
+            asm_group_id,
+            reply_to,
+        )
+
+    def send_transactional_templates(
+        self,
+        messages: List[Tuple[str, dict]],
+        from_email: str,
+        template_id: str,
+        asm_group_id: str,
+        reply_to: OptionalString = None,
+    ) -> List[Tuple[str, Union[Exception, None]]]:
+        """Given a list of (to_email, template_data) pairs that share a template,
+        sender, and unsubscribe group, send them with as few requests as we can.
+        Every recipient still gets their own email. Returns (to_email, error)
+        pairs in the same order, where error is None if the send worked."""
+        outcomes: List[Tuple[str, Union[Exception, None]]] = []
+        for i in range(0, len(messages), self.__max_personalizations):
+            chunk = messages[i : i + self.__max_personalizations]
+            outcomes.extend(
+                self.__send_chunk(
+                    chunk, from_email, template_id, asm_group_id, reply_to
+                )
+            )
+
+        return outcomes
+
+    def __rejected_personalizations(self, error: Exception) -> Union[Set[int], None]:
+        """Given an error from Sendgrid, return the indexes of the
+        personalizations it rejected, or None if it isn't a rejection of
+        particular recipients (a bad key, too big a request, throttling...)"""
+        if getattr(error, "status_code", None) != 400:
+            return None
+
+        try:
+            body = getattr(error, "body", b"")
+            errors = loads(body.decode() if isinstance(body, bytes) else body)["errors"]
+        except Exception:
+            return None
+
+        fields = [e.get("field") or "" for e in errors]
+        if not any(f.startswith("personalizations") for f in fields):
+            return None
+
+        # Fields look like "personalizations.3.to.0.email"
+        return {
+            int(m.group(1))
+            for m in (re.match(r"personalizations\.(\d+)", f) for f in fields)
+            if m
+        }
+
+    def __send_chunk(
+        self,
+        chunk: List[Tuple[str, dict]],
+        from_email: str,
+        template_id: str,
+        asm_group_id: str,
+        reply_to: OptionalString,
+        attempt: int = 0,
+    ) -> List[Tuple[str, Union[Exception, None]]]:
+        try:
+            self.__send(
+                [self.__personalization(to, data) for to, data in chunk],
+                from_email,
+                template_id,
+                asm_group_id,
+                reply_to,
+            )
+        except Exception as e:
+            args = (from_email, template_id, asm_group_id, reply_to)
+
+            # Sendgrid wants us to slow down, so wait and send it again
+            if getattr(e, "status_code", None) == 429:
+                if attempt >= self.__throttle_retries:
+                    return [(to, e) for to, _ in chunk]
+
+                time.sleep(self.__throttle_backoff_seconds * 2 ** attempt)
+                return self.__send_chunk(chunk, *args, attempt=attempt + 1)
+
+            # Anything other than bad recipients (a bad key, an outage...)
+            # would fail however we split the chunk up
+            rejected = self.__rejected_personalizations(e)
+            if rejected is None or len(chunk) == 1:
+                return [(to, e) for to, _ in chunk]
+
+            # Sendgrid rejects the whole request over one bad recipient. When
+            # it tells us which ones, fail those and send the rest again.
+            # Otherwise split the chunk in half until we find them.
+            rejected = {i for i in rejected if i < len(chunk)}
+            if rejected:
+                outcomes: List[Tuple[str, Union[Exception, None]]] = [
+                    (to, e if i in rejected else None)
+                    for i, (to, _) in enumerate(chunk)
+                ]
+                rest = [m for i, m in enumerate(chunk) if i not in rejected]
+                retried = iter(self.__send_chunk(rest, *args))
+                return [
+                    outcome if outcome[1] is not None else next(retried)
+                    for outcome in outcomes
+                ]
+
+            middle = len(chunk) // 2
+            return self.__send_chunk(chunk[:middle], *args) + self.__send_chunk(
+                chunk[middle:], *args
+            )
+
+        return [(to, None) for to, _ in chunk]
@@ -0,0 +1,71 @@
+# nexp.clients.messages
+
+from typing import Any, Union
+from json import dumps, loads
+from uuid import uuid4
+import os
+
+import boto3
+
+from nexp import utils
+
+
+class DirectoryQueue:
+    """A stand-in for a message queue made of JSON files in a directory, for
+    handing work to other processes on the same machine"""
+
+    # Workers on another machine can't reach files on this one
+    remote = False
+
+    def __init__(self, dirpath: str) -> None:
+        self.dirpath = dirpath
+        utils.mkdirp(dirpath)
+
+    def put(self, message: Any) -> None:
+        """Given a JSON serializable message, add it to the queue"""
+        name = f"{uuid4().hex}.json"
+        partial_filepath = os.path.join(self.dirpath, f".{name}.partial")
+        with open(partial_filepath, "w") as f:
+            f.write(dumps(message))
+
+        # Only show up once we're fully written
+        os.replace(partial_filepath, os.path.join(self.dirpath, name))
+
+    def get(self) -> Any:
+        """Take a message off the queue. Returns None once it's empty."""
+        for name in sorted(os.listdir(self.dirpath)):
+            if not name.endswith(".json"):
+                continue  # Early Continuation
+
+            # Renaming is atomic, so only one worker gets to claim a message
+            claimed_filepath = os.path.join(self.dirpath, f".{name}.{os.getpid()}")
+            try:
+                os.rename(os.path.join(self.dirpath, name), claimed_filepath)
+            except FileNotFoundError:
+                continue  # Early Continuation
+
+            with open(claimed_filepath) as f:
+                message = loads(f.read())
+            os.remove(claimed_filepath)
+            return message
+
+        return None
+
+
+class LambdaQueue:
+    """Hands each message to its own asynchronous invocation of a Lambda
+    function, which receives the message as its event"""
+
+    remote = True
+
+    def __init__(self, function_name: str, client: Union[Any, None] = None) -> None:
+        self.function_name = function_name
+        self.__client = client or boto3.client("lambda")
+
+    def put(self, message: Any) -> None:
+        """Given a JSON serializable message, invoke our function with it"""
+        self.__client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=dumps(message).encode("utf-8"),
+        )
@@ -0,0 +1,130 @@
+# nexp.clients.profiling
+
+from typing import Any, Dict, List, Union
+from hashlib import sha1
+from threading import Lock
+import re
+import sqlite3
+import time
+
+from nexp.aliases import ListAny
+
+
+class QueryProfiler:
+    """Runs queries against our local database while keeping track of how
+    they perform. Queries are grouped by their shape (the SQL with its
+    whitespace collapsed), so running the same query for every facility adds
+    up to one entry. Queries that build their SQL differently depending on
+    their arguments get an entry per variation, under the same name."""
+
+    # SQLite calls our progress handler once every this many virtual machine
+    # instructions, so step counts are only accurate to about this much
+    step_interval = 100
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        self.__profiles: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def shape(sql: str) -> str:
+        """Given some SQL, return it with all its whitespace collapsed"""
+        return re.sub(r"\s+", " ", sql).strip()
+
+    def __plan(
+        self, connection: sqlite3.Connection, sql: str, args: ListAny
+    ) -> List[str]:
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", args).fetchall()
+
+        # Each row is (id, parent, notused, detail). Indent children under
+        # their parents like the sqlite3 shell does.
+        depths = {0: -1}
+        plan = []
+        for id_, parent, _, detail in rows:
+            depths[id_] = depths.get(parent, -1) + 1
+            plan.append(f"{'  ' * depths[id_]}{detail}")
+        return plan
+
+    def run(
+        self,
+        connection: sqlite3.Connection,
+        sql: str,
+        args: ListAny,
+        name: Union[str, None] = None,
+    ) -> ListAny:
+        """Given a connection, some SQL, its arguments, and optionally a name
+        for the query, run it and return all of its rows, recording how long
+        it took, how many rows it returned, and how much work SQLite did. The
+        first time we see a query shape we also record its query plan. The
+        caller is expected to be holding whatever lock guards the
+        connection."""
+        shape = self.shape(sql)
+        with self.__lock:
+            known = shape in self.__profiles
+
+        plan = None if known else self.__plan(connection, sql, args)
+
+        steps = 0
+
+        def count_steps() -> int:
+            nonlocal steps
+            steps += self.step_interval
+            return 0  # Keep going
+
+        connection.set_progress_handler(count_steps, self.step_interval)
+        try:
+            started_at = time.perf_counter()
+            rows = connection.execute(sql, args).fetchall()
+            seconds = time.perf_counter() - started_at
+        finally:
+            connection.set_progress_handler(None, self.step_interval)
+
+        with self.__lock:
+            profile = self.__profiles.setdefault(
+                shape,
+                {
+                    "name": name,
+                    "shape": sha1(shape.encode("utf-8")).hexdigest()[:8],
+                    "sql": shape,
+                    "plan": plan,
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                    "max_rows": 0,
+                    "steps": 0,
+                    "max_steps": 0,
+                },
+            )
+            profile["calls"] += 1
+            profile["seconds"] += seconds
+            profile["max_seconds"] = max(profile["max_seconds"], seconds)
+            profile["rows"] += len(rows)
+            profile["max_rows"] = max(profile["max_rows"], len(rows))
+            profile["steps"] += steps
+            profile["max_steps"] = max(profile["max_steps"], steps)
+
+        return rows
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Return what we recorded for each query shape, slowest in total
+        first. Full table scans in each plan are called out under "scans",
+        since those are what hurt as our tables grow."""
+        with self.__lock:
+            profiles = [dict(p) for p in self.__profiles.values()]
+
+        for profile in profiles:
+            calls = profile["calls"]
+            profile["mean_seconds"] = profile["seconds"] / calls
+            profile["steps_per_row"] = profile["steps"] / max(profile["rows"], 1)
+            profile["scans"] = [
+                line.strip()
+                for line in profile["plan"] or []
+                if line.strip().startswith("SCAN")
+            ]
+
+        return sorted(profiles, key=lambda p: p["seconds"], reverse=True)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far"""
+        with self.__lock:
+            self.__profiles = {}
@@ -0,0 +1,99 @@
+# nexp.clients.sheets
+
+from typing import Any, Dict, Iterable, Tuple
+
+from nexp.aliases import ListAny
+from nexp.metrics import metrics
+
+
+class SheetsBatch:
+    """Collects value updates for any number of worksheets in one spreadsheet
+    and sends them with as few values.batchUpdate requests as Google allows,
+    instead of one request (plus a refresh) per range"""
+
+    # Google rejects value updates that touch more cells than this at once
+    max_cells = 50000
+
+    def __init__(self, client: Any, spreadsheet: Any) -> None:
+        self.client = client
+        self.spreadsheet = spreadsheet
+        self.requests = 0
+        self.__data: ListAny = []
+        self.__cells = 0
+        self.__extents: Dict[str, Tuple[Any, int, int]] = {}
+
+    def __range(self, worksheet: Any) -> str:
+        title = worksheet.title.replace("'", "''")
+        return f"'{title}'"
+
+    def clear(self, worksheets: Iterable[Any]) -> None:
+        """Given worksheets, clear all of their values in a single request"""
+        ranges = [self.__range(w) for w in worksheets]
+        if not ranges:
+            return  # Early Return
+
+        with metrics.timer("sheets.clears"):
+            self.client.sheet.values_batch_clear(self.spreadsheet.id, ranges)
+        self.requests += 1
+
+    def add(self, worksheet: Any, start: int, rows: ListAny) -> None:
+        """Given a worksheet, the row number to start at, and rows of values,
+        queue writing them. Sends what we have queued so far whenever the next
+        range would take us over the size limit."""
+        if not rows:
+            return  # Early Return
+
+        width = max(max(len(r) for r in rows), 1)
+        step = max(self.max_cells // width, 1)
+
+        for offset in range(0, len(rows), step):
+            values = rows[offset : offset + step]
+            cells = len(values) * width
+            if self.__data and self.__cells + cells > self.max_cells:
+                self.flush()
+
+            self.__data.append(
+                {
+                    "range": f"{self.__range(worksheet)}!A{start + offset}",
+                    "majorDimension": "ROWS",
+                    "values": values,
+                }
+            )
+            self.__cells += cells
+
+            _, last_row, last_col = self.__extents.get(worksheet.title, (None, 0, 0))
+            self.__extents[worksheet.title] = (
+                worksheet,
+                max(last_row, start + offset + len(values) - 1),
+                max(last_col, width),
+            )
+
+    def flush(self) -> None:
+        """Send everything queued so far"""
+        if not self.__data:
+            return  # Early Return
+
+        # Writing past the end of a worksheet fails, so grow them first
+        for worksheet, rows, cols in self.__extents.values():
+            if worksheet.rows < rows:
+                worksheet.rows = rows
+            if worksheet.cols < cols:
+                worksheet.cols = cols
+
+        request = (
+            self.client.sheet.service.spreadsheets()
+            .values()
+            .batchUpdate(
+                spreadsheetId=self.spreadsheet.id,
+                body={"valueInputOption": "USER_ENTERED", "data": self.__data},
+            )
+        )
+        # Goes through pygsheets so we get its retries on quota errors
+        with metrics.timer("sheets.writes"):
+            self.client.sheet._execute_requests(request)
+        self.requests += 1
+        metrics.count("sheets.cells", self.__cells)
+
+        self.__data = []
+        self.__cells = 0
+        self.__extents = {}
@@ -0,0 +1,120 @@
+# nexp.clients.snapshots
+
+from typing import Any, Dict, Union
+from os import path
+import os
+from tempfile import gettempdir
+import logging
+
+from nexp.aliases import OptionalString
+from nexp.clients.blobs import Blobs
+from nexp.clients.data import Data
+from nexp.config import config
+from nexp.metrics import metrics
+
+
+class Snapshots:
+    """Keeps filled copies of our local database around so that later runs
+    start from them and only pull what changed from Airtable. Snapshots live
+    on local disk (/tmp survives between warm Lambda invocations) and,
+    optionally, in S3 so that cold starts can use them too."""
+
+    def __init__(
+        self,
+        data: Data,
+        blobs: Blobs,
+        dirpath: OptionalString = None,
+        use_blobs: Union[bool, None] = None,
+    ) -> None:
+        self.data = data
+        self.blobs = blobs
+        self.dirpath = dirpath or config.snapshot_dirpath
+        self.use_blobs = config.snapshot_blobs if use_blobs is None else use_blobs
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.dirpath)
+
+    def filepath(self, name: str) -> str:
+        return path.join(str(self.dirpath), f"{name}.db")
+
+    def restore(self, name: str) -> bool:
+        """Given a snapshot name, load the most recent copy of it into our local
+        database. Returns whether or not we found one."""
+        if not self.enabled:
+            return False
+
+        filepath = self.filepath(name)
+        if not path.exists(filepath) and self.use_blobs:
+            try:
+                self.blobs.download_file("snapshots", f"{name}.db", filepath)
+            except Exception:
+                logging.exception(
+                    f"Failed downloading database snapshot. (name: {name})"
+                )
+
+        return self.data.load_snapshot(filepath)
+
+    def save(self, name: str) -> None:
+        """Given a snapshot name, save our local database under it"""
+        if not self.enabled:
+            return  # Early Return
+
+        filepath = self.filepath(name)
+        self.data.save_snapshot(filepath)
+
+        if self.use_blobs:
+            self.blobs.upload_file(filepath, "snapshots", f"{name}.db")
+
+    def publish(
+        self, name: str, dirpath: OptionalString = None, use_blobs: bool = True
+    ) -> Dict[str, Any]:
+        """Given a snapshot name, save our local database under it for other
+        processes to load with load_published, whether or not snapshots are
+        otherwise turned on. Returns where to find it.
+
+        These hold candidates' personal details, so copies in S3 go under
+        published/, which the bucket expires after a day, and the local copy is
+        removed once it's uploaded."""
+        filepath = path.join(str(dirpath or self.dirpath or gettempdir()), f"{name}.db")
+        self.data.save_snapshot(filepath)
+
+        if use_blobs:
+            try:
+                self.blobs.upload_file(filepath, "published", f"{name}.db")
+            finally:
+                os.remove(filepath)
+
+        return {"name": name, "filepath": filepath, "blobs": use_blobs}
+
+    def load_published(self, snapshot: Dict[str, Any]) -> bool:
+        """Given what publish returned, load that snapshot into our local
+        database as-is. We don't sync anything from Airtable on top of it, so
+        every process that loads it sees exactly the same data."""
+        filepath = snapshot["filepath"]
+        if path.exists(filepath) or not snapshot.get("blobs"):
+            return self.data.load_snapshot(filepath, filled=True)
+
+        # Don't leave a copy lying around in /tmp once it's in our database
+        filepath = path.join(gettempdir(), f"{snapshot['name']}.db")
+        try:
+            self.blobs.download_file("published", f"{snapshot['name']}.db", filepath)
+            return self.data.load_snapshot(filepath, filled=True)
+        finally:
+            if path.exists(filepath):
+                os.remove(filepath)
+
+    def fill(self, name: str, **kwargs: Any) -> None:
+        """Given a snapshot name and any arguments for Data.fill, fill our local
+        database starting from that snapshot and save the result back to it.
+        When this process has already filled the database (a warm Lambda) we
+        just apply the latest changes on top of it."""
+        if not self.data.filled:
+            with metrics.timer("snapshot.restore"):
+                self.restore(name)
+
+        with metrics.timer("fill"):
+            self.data.fill(**kwargs)
+
+        with metrics.timer("snapshot.save"):
+            self.save(name)
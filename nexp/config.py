@@ -5,6 +5,7 @@ from cached_property import cached_property
 from os.path import dirname, join, realpath
 from json import loads
 from os import environ
+from tempfile import gettempdir
 
 
 class Config:
@@ -30,6 +31,45 @@ class Config:
         """When should S3 URLs expire?"""
         return int(environ.get("S3_URL_EXPIRY_SECONDS", 60 * 60 * 12))
 
+    @cached_property
+    def s3_concurrency(self) -> int:
+        """How many uploads to S3 should we have in flight at once?"""
+        return int(environ.get("S3_CONCURRENCY", 4))
+
+    @cached_property
+    def candidate_list_workers(self) -> int:
+        """How many facilities should we build and send candidate lists for
+        at once?"""
+        return int(environ.get("NEXP_CANDIDATE_LIST_WORKERS", 1))
+
+    @cached_property
+    def candidate_list_shards(self) -> int:
+        """Into how many shards, each sent by its own worker, should we split
+        the facilities getting candidate lists?"""
+        return int(environ.get("NEXP_CANDIDATE_LIST_SHARDS", 1))
+
+    @cached_property
+    def candidate_list_shard_function(self) -> OptionalString:
+        """What Lambda function sends a shard of candidate lists?"""
+        return environ.get("NEXP_CANDIDATE_LIST_SHARD_FUNCTION")
+
+    @cached_property
+    def deadline_margin_seconds(self) -> float:
+        """How many seconds before Lambda would cut us off should we stop
+        starting new work?"""
+        return float(environ.get("NEXP_DEADLINE_MARGIN_SECONDS", 60))
+
+    @cached_property
+    def metrics_namespace(self) -> str:
+        """Under what CloudWatch namespace should we report run metrics?"""
+        return environ.get("NEXP_METRICS_NAMESPACE", "nexp")
+
+    @cached_property
+    def profile_queries(self) -> bool:
+        """Should we time and record the plan of every query we run against
+        the local database?"""
+        return environ.get("NEXP_PROFILE_QUERIES", "false").lower() == "true"
+
     @cached_property
     def airtable_api_key(self) -> str:
         """Your Airtable API Key"""
@@ -40,6 +80,21 @@ class Config:
         """The ID identifying the base where you data is stored"""
         return environ["AIRTABLE_BASE_ID"]
 
+    @cached_property
+    def airtable_capture(self) -> OptionalString:
+        """Should we record what we read from Airtable ("record"), or read it
+        back from a recording instead of Airtable ("replay")?"""
+        return environ.get("NEXP_AIRTABLE_CAPTURE")
+
+    @cached_property
+    def airtable_capture_dirpath(self) -> str:
+        """Where do Airtable recordings live? Defaults to somewhere under the
+        temp directory, so recordings stay out of the source tree (and out of
+        what we deploy)."""
+        return environ.get(
+            "NEXP_AIRTABLE_CAPTURE_DIRPATH", join(gettempdir(), "nexp-capture")
+        )
+
     @cached_property
     def airtable_candidates_table(self) -> str:
         """The name of the candidates table in Airtable"""
@@ -70,11 +125,68 @@ class Config:
         """The name of the candidate tags table in Airtable"""
         return environ.get("AIRTABLE_CANDIDATE_TAGS_TABLE", "Candidate Tags")
 
+    @cached_property
+    def airtable_requests_per_second(self) -> float:
+        """How many requests per second can we make against the Airtable base?"""
+        return float(environ.get("AIRTABLE_REQUESTS_PER_SECOND", 5))
+
+    @cached_property
+    def airtable_burst(self) -> float:
+        """How many requests can we make against the Airtable base at once
+        after a quiet spell?"""
+        return float(environ.get("AIRTABLE_BURST", 1))
+
+    @cached_property
+    def airtable_throttle_cooldown_seconds(self) -> float:
+        """How long should we hold off after Airtable throttles us?"""
+        return float(environ.get("AIRTABLE_THROTTLE_COOLDOWN_SECONDS", 30))
+
+    @cached_property
+    def airtable_throttle_retries(self) -> int:
+        """How many times should we retry a request Airtable throttled?"""
+        return int(environ.get("AIRTABLE_THROTTLE_RETRIES", 3))
+
+    @cached_property
+    def airtable_fill_workers(self) -> int:
+        """How many tables should we pull from Airtable at the same time?"""
+        return int(environ.get("AIRTABLE_FILL_WORKERS", 5))
+
+    @cached_property
+    def airtable_write_concurrency(self) -> int:
+        """How many writes to Airtable should we have in flight at once?"""
+        return int(environ.get("AIRTABLE_WRITE_CONCURRENCY", 2))
+
+    @cached_property
+    def airtable_incremental_sync(self) -> bool:
+        """Should we only pull records that changed since our last sync?"""
+        return environ.get("AIRTABLE_INCREMENTAL_SYNC", "false").lower() == "true"
+
+    @cached_property
+    def airtable_full_sync_interval_seconds(self) -> int:
+        """How often should an incremental sync fall back to a full sync?"""
+        return int(environ.get("AIRTABLE_FULL_SYNC_INTERVAL_SECONDS", 60 * 60 * 24))
+
+    @cached_property
+    def snapshot_dirpath(self) -> OptionalString:
+        """Where should we keep snapshots of our local database? Unset turns
+        snapshots off."""
+        return environ.get("NEXP_SNAPSHOT_DIRPATH")
+
+    @cached_property
+    def snapshot_blobs(self) -> bool:
+        """Should we also keep database snapshots in S3?"""
+        return environ.get("NEXP_SNAPSHOT_BLOBS", "false").lower() == "true"
+
     @cached_property
     def sendgrid_api_key(self) -> str:
         """Your Sendgrid API Key"""
         return environ["SENDGRID_API_KEY"]
 
+    @cached_property
+    def sendgrid_concurrency(self) -> int:
+        """How many emails should we have in flight to Sendgrid at once?"""
+        return int(environ.get("SENDGRID_CONCURRENCY", 4))
+
     @cached_property
     def override_email_destination(self) -> OptionalString:
         """Override all email destinations. Mainly for testing..."""
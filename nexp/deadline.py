@@ -0,0 +1,31 @@
+# nexp.deadline
+
+from typing import Any, Union
+import math
+import time
+
+
+class Deadline:
+    """Keeps track of how long we have left before we get cut off"""
+
+    def __init__(self, seconds: Union[float, None] = None) -> None:
+        self.__ends_at = None if seconds is None else time.monotonic() + seconds
+
+    @classmethod
+    def from_context(cls, context: Any) -> "Deadline":
+        """Given the context Lambda hands our handlers, return the deadline it
+        runs us under. Without one (say, from the CLI) we never run out of
+        time."""
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            return cls()
+        return cls(context.get_remaining_time_in_millis() / 1000.0)
+
+    def remaining(self) -> float:
+        """How many seconds do we have left?"""
+        if self.__ends_at is None:
+            return math.inf
+        return max(self.__ends_at - time.monotonic(), 0.0)
+
+    def expired(self, margin: float = 0.0) -> bool:
+        """Given a margin in seconds, do we have less than that left?"""
+        return self.remaining() <= margin
@@ -0,0 +1,122 @@
+# nexp.metrics
+
+from typing import Any, Dict, Generator, List, Union
+from contextlib import contextmanager
+from json import dumps
+from threading import Lock
+import logging
+import time
+
+from nexp.config import config
+
+
+class Metrics:
+    """Collects counters and timings from every thread working on a run, so
+    we can report where the run spent its time in one structured record"""
+
+    # CloudWatch takes at most this many metrics per directive
+    __max_metrics_per_directive = 100
+
+    def __init__(self, namespace: Union[str, None] = None) -> None:
+        self.namespace = namespace
+        self.__lock = Lock()
+        self.__counters: Dict[str, float] = {}
+        self.__timers: Dict[str, List[float]] = {}
+
+    def reset(self) -> None:
+        """Forget everything recorded so far. Warm Lambda containers reuse
+        this module, so every run starts by calling this."""
+        with self.__lock:
+            self.__counters = {}
+            self.__timers = {}
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Given a counter name and an optional amount, add to that counter"""
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def record(self, name: str, seconds: float) -> None:
+        """Given a timer name and a duration in seconds, record one timing"""
+        with self.__lock:
+            count, total, longest = self.__timers.get(name, (0, 0.0, 0.0))
+            self.__timers[name] = [count + 1, total + seconds, max(longest, seconds)]
+
+    @contextmanager
+    def timer(self, name: str) -> Generator[None, None, None]:
+        """Given a timer name, time the block this wraps, even if it raises"""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started_at)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return every value recorded so far, keyed by metric name. Each timer
+        becomes "<name>.seconds" (the total), "<name>.max_seconds", and
+        "<name>.count"."""
+        with self.__lock:
+            values = dict(self.__counters)
+            for name, (count, total, longest) in self.__timers.items():
+                values[f"{name}.seconds"] = round(total, 6)
+                values[f"{name}.max_seconds"] = round(longest, 6)
+                values[f"{name}.count"] = count
+
+        return dict(sorted(values.items()))
+
+    def __unit(self, name: str) -> str:
+        if name.endswith("seconds"):
+            return "Seconds"
+        if name.endswith("bytes"):
+            return "Bytes"
+        return "Count"
+
+    def embedded(self, function: str) -> Dict[str, Any]:
+        """Given the name of the function that ran, return everything recorded
+        so far as a CloudWatch embedded metric format record"""
+        values = self.snapshot()
+        names = list(values)
+        step = self.__max_metrics_per_directive
+
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace or config.metrics_namespace,
+                        "Dimensions": [["Function"]],
+                        "Metrics": [
+                            {"Name": n, "Unit": self.__unit(n)}
+                            for n in names[i : i + step]
+                        ],
+                    }
+                    for i in range(0, len(names), step)
+                ],
+            },
+            "Function": function,
+            **values,
+        }
+
+    def emit(self, function: str) -> None:
+        """Given the name of the function that ran, write everything recorded
+        so far to stdout as a single line. CloudWatch picks the metrics out of
+        Lambda's logs, so this goes around our log formatting."""
+        try:
+            print(dumps(self.embedded(function)), flush=True)
+        except Exception:
+            logging.exception(f"Failed emitting metrics. (function: {function})")
+
+    @contextmanager
+    def run(self, function: str) -> Generator[None, None, None]:
+        """Given the name of the function about to run, start recording from
+        scratch, time the whole run, and emit the metrics once it's over (even
+        if it fails)"""
+        self.reset()
+        try:
+            with self.timer("run"):
+                yield
+        finally:
+            self.emit(function)
+
+
+# Shared by everything in a process
+metrics = Metrics()
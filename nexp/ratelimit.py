@@ -0,0 +1,151 @@
+# nexp.ratelimit
+
+from typing import Any, Callable, Dict, Union
+from threading import Lock
+import logging
+import time
+
+from nexp.metrics import metrics
+
+
+def is_throttled(error: Exception) -> bool:
+    """Given an error from an API client, was it the API telling us to slow
+    down? The airtable client re-raises HTTP errors with just their message,
+    which starts with the status code."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or str(error).startswith("429")
+
+
+class RateLimiter:
+    """A token bucket shared by every thread making requests against one API,
+    so that together they make no more than `requests_per_second` of them
+    (with up to `burst` at once after a quiet spell).
+
+    When the API throttles us anyway we back off: the rate is halved, nobody
+    makes a request for `cooldown_seconds`, and the request is retried. Each
+    request that goes through nudges the rate back up towards
+    `requests_per_second`, so we settle just under whatever the API will
+    actually take."""
+
+    # The rate never drops below this fraction of requests_per_second
+    __min_rate_fraction = 1 / 16
+
+    # Each successful request gives back this fraction of requests_per_second
+    __increase_fraction = 1 / 20
+
+    def __init__(
+        self,
+        requests_per_second: float,
+        burst: float = 1,
+        cooldown_seconds: float = 0.0,
+        max_retries: int = 0,
+        name: str = "airtable",
+    ) -> None:
+        self.ceiling = max(requests_per_second, 0.0)
+        self.rate = self.ceiling
+        self.burst = max(burst, 1)
+        self.cooldown_seconds = cooldown_seconds
+        self.max_retries = max_retries
+        self.name = name
+        self.__lock = Lock()
+        self.__tokens = float(self.burst)
+        self.__updated_at = time.monotonic()
+        self.__paused_until = 0.0
+        self.__stats: Dict[str, float] = {
+            "requests": 0,
+            "throttled": 0,
+            "retries": 0,
+            "waited_seconds": 0.0,
+        }
+
+    def __refill(self, now: float) -> None:
+        elapsed = max(now - self.__updated_at, 0.0)
+        self.__tokens = min(self.burst, self.__tokens + elapsed * self.rate)
+        self.__updated_at = now
+
+    def acquire(self) -> None:
+        """Block until the caller is allowed to make its next request"""
+        if not self.ceiling:
+            self.__record("requests", 1)
+            return  # Early Return
+
+        waited = 0.0
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__refill(now)
+
+                if now < self.__paused_until:
+                    wait = self.__paused_until - now
+                elif self.__tokens >= 1:
+                    self.__tokens -= 1
+                    break
+                else:
+                    wait = (1 - self.__tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+        self.__record("requests", 1)
+        if waited:
+            self.__record("waited_seconds", waited)
+
+    def throttled(self) -> None:
+        """Tell the limiter the API just throttled us. Halves the rate and
+        holds everyone off for the cooldown."""
+        with self.__lock:
+            self.rate = max(self.rate / 2, self.ceiling * self.__min_rate_fraction)
+            self.__tokens = 0.0
+            self.__updated_at = time.monotonic()
+            self.__paused_until = max(
+                self.__paused_until, self.__updated_at + self.cooldown_seconds
+            )
+            rate = self.rate
+
+        self.__record("throttled", 1)
+        logging.warning(
+            f"Throttled by API. Backing off. (api: {self.name}; requests per second: {rate:.2f}; cooldown seconds: {self.cooldown_seconds})"
+        )
+
+    def succeeded(self) -> None:
+        """Tell the limiter a request went through, so it can speed back up"""
+        with self.__lock:
+            self.rate = min(
+                self.ceiling, self.rate + self.ceiling * self.__increase_fraction
+            )
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Given a function that makes one request and its arguments, call it
+        once we're allowed to, retrying (up to max_retries times) whenever the
+        API throttles us. Returns whatever the function does."""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_throttled(e):
+                    raise e
+
+                self.throttled()
+                if attempt >= self.max_retries:
+                    raise e
+
+                attempt += 1
+                self.__record("retries", 1)
+                continue  # Early Continuation
+
+            self.succeeded()
+            return result
+
+    def __record(self, key: str, value: float) -> None:
+        with self.__lock:
+            self.__stats[key] += value
+        metrics.count(f"{self.name}.{key}", value)
+
+    def stats(self) -> Dict[str, Union[float, int]]:
+        """Return how many requests we've let through, how many of them were
+        throttled and retried, how long callers waited on us in total, and the
+        rate we're currently allowing"""
+        with self.__lock:
+            return {**self.__stats, "requests_per_second": self.rate}
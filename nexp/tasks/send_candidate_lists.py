@@ -1,7 +1,11 @@
 # nexp.tasks.send_candidate_lists
 
-from typing import Any, Tuple
-from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterable, List, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+from json import dumps
+from threading import BoundedSemaphore
 from os import path
 import logging
 
@@ -9,7 +13,11 @@ import xlsxwriter
 
 from nexp.clients.data import ModelIterator
 from nexp.clients.all import Clients
+from nexp.clients.checkpoints import Checkpoint
 from nexp.aliases import ListAny, OptionalString
+from nexp.config import config
+from nexp.deadline import Deadline
+from nexp.metrics import metrics
 from nexp import utils
 from nexp.utils import Sheet
 
@@ -56,41 +64,71 @@ class SendCandidateLists:
         ("interest_and_ability", "Interest and Ability"),
     )
 
-    def __init__(self, clients: Clients, dryrun: bool = False):
+    # Pulls each of those columns' values out of a candidate's fields
+    __candidate_converters = utils.column_converters(__candidate_columns)
+
+    def __init__(
+        self,
+        clients: Clients,
+        dryrun: bool = False,
+        workers: Union[int, None] = None,
+        deadline: Union[Deadline, None] = None,
+        checkpoint: Union[Checkpoint, None] = None,
+        facility_ids: Union[Iterable[str], None] = None,
+    ):
         self.clients = clients
         self.__dryrun = dryrun
+        self.__workers = workers or config.candidate_list_workers
+
+        # Given facility ids (say, one shard's worth) we only send to those
+        self.__facility_ids = None if facility_ids is None else set(facility_ids)
+
+        # When running under a time limit we stop starting facilities a little
+        # before we'd get cut off, and record which ones we finished so the
+        # next invocation can pick up the rest
+        self.__deadline = deadline or Deadline()
+        self.__checkpoint = checkpoint
+        self.__unfinished: ListAny = []
+
+        # Facilities are handled on a pool of workers, but each service only
+        # sees so many of them at once
+        self.__uploads = BoundedSemaphore(config.s3_concurrency)
+        self.__emails = BoundedSemaphore(config.sendgrid_concurrency)
+        self.__airtable_writes = BoundedSemaphore(config.airtable_write_concurrency)
+
+    @classmethod
+    def required_fields(cls) -> Dict[str, List[str]]:
+        """Which fields, beyond the ones matching uses, does this task need
+        pulled down from each table?"""
+        return {
+            "candidates": [
+                key
+                for key, _ in cls.__candidate_columns
+                if key != "previouslySentGroup"
+            ]
+        }
 
     def get_facility_candidates(self, facility: Any) -> ModelIterator:
         """Given a facility object, returns a generator of candidates that match
         their latest filter criteria"""
         return self.clients.data.candidates_for_facility(facility)
 
-    def write_excel_file(
-        self, facility: Any, dirpath: str, data: ListAny
-    ) -> Tuple[str, str]:
-        """Given a facility object, a directory path (for the xlsx file), and
-        a generator that yields candidate records, fill a xlsx file with the
-        candidate data and return its filepath and filename"""
-        filename = (
-            f"{facility.facility_name.strip()} - {utils.filename_date_string()}.xlsx"
-        )
-        filepath = path.join(dirpath, f"{facility.id_}-{filename}")
-
-        workbook = xlsxwriter.Workbook(filepath)
+    def excel_filename(self, facility: Any) -> str:
+        """Given a facility object, return the name of its candidates file"""
+        return f"{facility.facility_name.strip()} - {utils.filename_date_string()}.xlsx"
 
+    def __fill_workbook(self, workbook: Any, data: ListAny) -> None:
         sheet = Sheet(workbook, "Candidates")
 
         # Write the header
-        for i, (_, name) in enumerate(self.__candidate_columns):
-            sheet.data_sheet.write(0, i, name)
-            sheet.set_widths(i, len(name))
+        sheet.write_row([name for _, name in self.__candidate_columns])
 
         # Write the rows for new candidates first and then old ones
         new_candidates = [x for x in data if x.previouslySentGroup == "No"]
         previously_sent_candidates = [x for x in data if x.previouslySentGroup == "Yes"]
 
-        sheet.write_candidates(new_candidates, self.__candidate_columns)
-        sheet.write_candidates(previously_sent_candidates, self.__candidate_columns)
+        sheet.write_candidates(new_candidates, self.__candidate_converters)
+        sheet.write_candidates(previously_sent_candidates, self.__candidate_converters)
 
         # Set the column widths to the lengths of their longest values. These
         # numbers aren't strictly "right", but in practice they get us relatively
@@ -101,23 +139,92 @@ class SendCandidateLists:
         sheet.space_column_widths()
 
         workbook.close()
+
+    def write_excel_file(
+        self, facility: Any, dirpath: str, data: ListAny
+    ) -> Tuple[str, str]:
+        """Given a facility object, a directory path (for the xlsx file), and
+        a generator that yields candidate records, fill a xlsx file with the
+        candidate data and return its filepath and filename"""
+        filename = self.excel_filename(facility)
+        filepath = path.join(dirpath, f"{facility.id_}-{filename}")
+
+        # Rows get flushed to disk as we go rather than held until close
+        with metrics.timer("xlsx"):
+            self.__fill_workbook(
+                xlsxwriter.Workbook(filepath, {"constant_memory": True}), data
+            )
         return filepath, filename
 
+    def build_excel_file(self, facility: Any, data: ListAny) -> Tuple[BytesIO, str]:
+        """Given a facility object and its candidate records, build their xlsx
+        file in memory and return it (rewound, ready to upload) along with its
+        filename. Nothing touches the disk, so lots of these can be built at
+        once without filling up /tmp."""
+        buffer = BytesIO()
+
+        # xlsxwriter otherwise stages each part of the workbook in a temporary
+        # file. This turns off constant_memory, but a facility's list is small.
+        with metrics.timer("xlsx"):
+            self.__fill_workbook(xlsxwriter.Workbook(buffer, {"in_memory": True}), data)
+
+        metrics.count("xlsx.bytes", buffer.seek(0, 2))
+        buffer.seek(0)
+        return buffer, self.excel_filename(facility)
+
+    def list_digest(self, data: ListAny) -> str:
+        """Given a facility's candidate records, return a hash of everything
+        that ends up in their xlsx file. Identical lists hash the same no matter
+        what day they were made on."""
+        digest = sha256()
+        digest.update(dumps([name for _, name in self.__candidate_columns]).encode())
+
+        for group in ("No", "Yes"):
+            for record in (x for x in data if x.previouslySentGroup == group):
+                fields = record.fields
+                row = [record.id_] + [
+                    convert(fields) for convert in self.__candidate_converters
+                ]
+                digest.update(dumps(row, default=str).encode())
+
+        return digest.hexdigest()
+
     def upload_facility_list(
-        self,
-        facility: Any,
-        filepath: str,
-        filename: str,
-        content_type: OptionalString = None,
+        self, facility: Any, candidates: ListAny, content_type: OptionalString = None,
     ) -> str:
-        """Given the facility object, filepath, filename, and an optional content,
-        upload a file to S3 and return its presigned GET url"""
+        """Given the facility object, its candidates, and an optional content
+        type, make sure their xlsx file is in S3 and return its presigned GET
+        url. Files are stored by a hash of their contents, so when a facility's
+        list hasn't changed since we last sent it we reuse the file we already
+        uploaded instead of building and uploading it again."""
         content_type = content_type or self.__candidate_file_content_type
 
-        response = self.clients.blobs.upload_file_and_presign(
-            filepath, "candidates", f"{facility.id_}/{filename}", content_type
+        digest = self.list_digest(candidates)
+        filename = f"{facility.id_}/{digest}.xlsx"
+
+        with self.__uploads, metrics.timer("s3.exists"):
+            exists = self.clients.blobs.exists("candidates", filename)
+
+        if exists:
+            metrics.count("s3.reused")
+            logging.info(
+                f"Reusing unchanged candidates list. (facility: {facility.facility_name}; digest: {digest})"
+            )
+        else:
+            fileobj, _ = self.build_excel_file(facility, candidates)
+            with self.__uploads, metrics.timer("s3.upload"):
+                self.clients.blobs.upload_fileobj(
+                    fileobj,
+                    "candidates",
+                    filename,
+                    content_type,
+                    metadata={"sha256": digest},
+                )
+
+        # Folks still download it under today's name
+        return self.clients.blobs.presign(
+            "candidates", filename, self.excel_filename(facility)
         )
-        return response
 
     def send_facility_candiates_email(
         self, facility: Any, download_url: str, count: int
@@ -126,38 +233,37 @@ class SendCandidateLists:
         send them and email"""
         datestring = utils.display_date_string()
 
-        self.clients.email.send_transactional_template(
-            facility.contact_email.lower().strip(),
-            self.clients.data.send_email_from,
-            self.clients.data.candidates_template_id,
-            self.clients.data.unsubscribe_group_id,
-            {
-                "download_url": download_url,
-                "feedback_form_url": utils.prefill_facility_link(
-                    self.clients.data.feedback_form_url, facility.id_
-                ),
-                "date": datestring,
-                "name": facility.contact_name,
-                "facility_name": facility.facility_name,
-                "candidate_count_string": f"are {count} candidates"
-                if count > 1
-                else "is 1 candidate",
-            },
-        )
+        with self.__emails:
+            self.clients.email.send_transactional_template(
+                facility.contact_email.lower().strip(),
+                self.clients.data.send_email_from,
+                self.clients.data.candidates_template_id,
+                self.clients.data.unsubscribe_group_id,
+                {
+                    "download_url": download_url,
+                    "feedback_form_url": utils.prefill_facility_link(
+                        self.clients.data.feedback_form_url, facility.id_
+                    ),
+                    "date": datestring,
+                    "name": facility.contact_name,
+                    "facility_name": facility.facility_name,
+                    "candidate_count_string": f"are {count} candidates"
+                    if count > 1
+                    else "is 1 candidate",
+                },
+            )
 
     def handle_facility_with_candidates(
-        self, facility: Any, dirpath: str, candidates: ListAny
+        self, facility: Any, candidates: ListAny
     ) -> None:
-        """Given a facility object, the directory path in which to store
-        temporary files, and a list of candiates, throw candidates in an xlsx file,
-        upload it to S3, and send an email to the facility point of contact
-        with a link to that file included."""
+        """Given a facility object and a list of candiates, throw candidates in
+        an xlsx file, upload it to S3, and send an email to the facility point
+        of contact with a link to that file included."""
 
-        self.clients.data.update_facility_no_candidates_suppression(facility, False)
+        with self.__airtable_writes:
+            self.clients.data.update_facility_no_candidates_suppression(facility, False)
 
-        filepath, filename = self.write_excel_file(facility, dirpath, candidates)
-
-        url = self.upload_facility_list(facility, filepath, filename)
+        url = self.upload_facility_list(facility, candidates)
 
         if self.__dryrun:
             logging.info(
@@ -166,9 +272,11 @@ class SendCandidateLists:
             return  # Early Return
 
         self.send_facility_candiates_email(facility, url, len(candidates))
-        self.clients.data.track_candidates(
-            facility.contact_email.lower().strip(), facility, candidates
-        )
+
+        with self.__airtable_writes:
+            self.clients.data.track_candidates(
+                facility.contact_email.lower().strip(), facility, candidates
+            )
 
         logging.info(
             f"Sent candiates list email to facility. (facility: {facility.facility_name})"
@@ -185,9 +293,10 @@ class SendCandidateLists:
             return  # Early Return
 
         # Let's add a record to the tracking table
-        self.clients.data.track_candidates(
-            facility.contact_email.lower().strip(), facility, []
-        )
+        with self.__airtable_writes:
+            self.clients.data.track_candidates(
+                facility.contact_email.lower().strip(), facility, []
+            )
 
         if (
             hasattr(facility, "suppress_no_candidates_email")
@@ -198,56 +307,112 @@ class SendCandidateLists:
             )
             return  # Early Return
 
-        self.clients.data.update_facility_no_candidates_suppression(facility, True)
-
-        self.clients.email.send_transactional_template(
-            facility.contact_email,
-            self.clients.data.send_email_from,
-            self.clients.data.no_candidates_template_id,
-            self.clients.data.unsubscribe_group_id,
-            {
-                "feedback_form_url": utils.prefill_facility_link(
-                    self.clients.data.feedback_form_url, facility.id_
-                ),
-                "date": utils.display_date_string(),
-                "name": facility.contact_name,
-            },
-        )
+        with self.__airtable_writes:
+            self.clients.data.update_facility_no_candidates_suppression(facility, True)
+
+        with self.__emails:
+            self.clients.email.send_transactional_template(
+                facility.contact_email,
+                self.clients.data.send_email_from,
+                self.clients.data.no_candidates_template_id,
+                self.clients.data.unsubscribe_group_id,
+                {
+                    "feedback_form_url": utils.prefill_facility_link(
+                        self.clients.data.feedback_form_url, facility.id_
+                    ),
+                    "date": utils.display_date_string(),
+                    "name": facility.contact_name,
+                },
+            )
 
         logging.info(
             f"Sent no candidates email to facility. (facility: {facility.facility_name})"
         )
 
-    def handle_facility(self, facility: Any, dirpath: str) -> None:
-        """Given a facility object and the directory path in which to store
-        temporary files, find matching candidates. Based on the count, determine
-        whether we'll be sending them a list of candiates or following the no
-        canidates path"""
+    def handle_facility(
+        self, facility: Any, candidates: Union[ListAny, None] = None
+    ) -> None:
+        """Given a facility object, and optionally its already matched
+        candidates, find matching candidates. Based on the count, determine whether we'll be
+        sending them a list of candiates or following the no canidates path"""
 
-        candidates = list(self.get_facility_candidates(facility))
+        if candidates is None:
+            with metrics.timer("matching.facility"):
+                candidates = list(self.get_facility_candidates(facility))
 
         if len(candidates):
-            return self.handle_facility_with_candidates(facility, dirpath, candidates)
+            return self.handle_facility_with_candidates(facility, candidates)
         else:
             return self.handle_facility_without_candidates(facility)
 
+    def __run_facility(self, facility: Any, candidates: ListAny) -> None:
+        if self.__deadline.expired(config.deadline_margin_seconds):
+            self.__unfinished.append(facility.id_)
+            metrics.count("facilities.deferred")
+            return  # Early Return
+
+        try:
+            with metrics.timer("facility"):
+                self.handle_facility(facility, candidates)
+        except:
+            self.__unfinished.append(facility.id_)
+            metrics.count("facilities.failed")
+            logging.exception(
+                f"Failed handling candidates list for facility. (facility: '{facility.facility_name}; email: ({facility.contact_email})')"
+            )
+        else:
+            metrics.count("facilities.finished")
+            if self.__checkpoint and not self.__dryrun:
+                self.__checkpoint.mark(facility.id_)
+
+            logging.info(
+                f"Finished candiates list task for facility. (facility: {facility.facility_name}; email: {facility.contact_email})"
+            )
+
+    def pending_facilities(self) -> ModelIterator:
+        """Yield the facilities this run still has to send to, most pressing
+        first"""
+        for facility in self.clients.data.facilities_in_need_by_priority():
+            if (
+                self.__facility_ids is not None
+                and facility.id_ not in self.__facility_ids
+            ):
+                continue  # Early Continuation
+
+            if not hasattr(facility, "contact_email") or not facility.contact_email:
+                logging.warn(
+                    f"Could not send candidates list to facility. Email missing (facility: '{facility.facility_name}')"
+                )
+                continue  # Early Continuation
+
+            if self.__checkpoint and self.__checkpoint.is_done(facility.id_):
+                continue  # Early Continuation
+
+            yield facility
+
     def __call__(self) -> None:
-        """Send out candidate lists to all approved facilities"""
-        with TemporaryDirectory() as dirpath:
-            for facility in self.clients.data.facilities_in_need():
-                if not hasattr(facility, "contact_email") or not facility.contact_email:
-                    logging.warn(
-                        f"Could not send candidates list to facility. Email missing (facility: '{facility.facility_name}')"
+        """Send out candidate lists to all approved facilities, most pressing
+        first. Matching happens up front on this thread; building, uploading,
+        and sending each facility's list happens on a pool of workers."""
+        matches = self.clients.data.candidates_for_facilities_in_need()
+
+        # Pull the configuration before the workers all go looking for it
+        self.clients.data.config
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+                for facility in self.pending_facilities():
+                    pool.submit(
+                        self.__run_facility, facility, matches.get(facility.id_, []),
                     )
-                    continue  # Early Continuation
+        finally:
+            # Tracking records and suppression flags are written in batches
+            self.clients.data.flush()
 
-                try:
-                    self.handle_facility(facility, dirpath)
-                except:
-                    logging.exception(
-                        f"Failed handling candidates list for facility. (facility: '{facility.facility_name}; email: ({facility.contact_email})')"
-                    )
-                else:
-                    logging.info(
-                        f"Finished candiates list task for facility. (facility: {facility.facility_name}; email: {facility.contact_email})"
-                    )
+            if self.__checkpoint and not self.__dryrun:
+                self.__checkpoint.save(complete=not self.__unfinished)
+
+        if self.__unfinished:
+            logging.warn(
+                f"Left facilities for the next run. (facilities: {len(self.__unfinished)}; seconds remaining: {self.__deadline.remaining():.0f})"
+            )
@@ -1,6 +1,6 @@
 # nexp.tasks.send_needs_requests
 
-from typing import Any
+from typing import Any, Dict, List, Tuple
 import logging
 
 from nexp.clients.all import Clients
@@ -15,35 +15,31 @@ class SendNeedsRequests:
         self.clients = clients
         self.__dryrun = dryrun
 
-    def handle_facility(self, facility: Any) -> None:
-        """Send the needs request email to the given facility"""
-        if self.__dryrun:
-            logging.info(
-                f"Not sending email during dry run. (facility: {facility.facility_name})"
-            )
-            return  # Early Return
+    @classmethod
+    def required_fields(cls) -> Dict[str, List[str]]:
+        """Which fields, beyond the ones matching uses, does this task need
+        pulled down from each table?"""
+        return {"facilities": ["contact_email", "contact_name", "facility_name"]}
 
-        date_string = utils.display_date_string()
-        self.clients.email.send_transactional_template(
-            facility.contact_email.lower().strip(),
-            self.clients.data.send_email_from,
-            self.clients.data.needs_template_id,
-            self.clients.data.unsubscribe_group_id,
-            template_data={
-                "name": facility.contact_name,
-                "facility_name": facility.facility_name,
-                "date": date_string,
-                "feedback_form_url": utils.prefill_facility_link(
-                    self.clients.data.feedback_form_url, facility.id_
-                ),
-                "needs_form_url": utils.prefill_facility_link(
-                    self.clients.data.needs_form_url, facility.id_
-                ),
-            },
-        )
+    def template_data(self, facility: Any) -> dict:
+        """Given a facility, return the data for its needs request email"""
+        return {
+            "name": facility.contact_name,
+            "facility_name": facility.facility_name,
+            "date": utils.display_date_string(),
+            "feedback_form_url": utils.prefill_facility_link(
+                self.clients.data.feedback_form_url, facility.id_
+            ),
+            "needs_form_url": utils.prefill_facility_link(
+                self.clients.data.needs_form_url, facility.id_
+            ),
+        }
 
     def __call__(self) -> None:
-        """Send needs request emails to all facilities"""
+        """Send needs request emails to all facilities. Everyone gets the same
+        template, so they're sent in batches rather than one request each."""
+        facilities: List[Any] = []
+        messages: List[Tuple[str, dict]] = []
         for facility in self.clients.data.list_facilities():
             if not hasattr(facility, "contact_email") or not facility.contact_email:
                 logging.warn(
@@ -51,11 +47,39 @@ class SendNeedsRequests:
                 )
                 continue  # Early Continuation
 
+            if self.__dryrun:
+                logging.info(
+                    f"Not sending email during dry run. (facility: {facility.facility_name})"
+                )
+                continue  # Early Continuation
+
+            # One facility with bad data shouldn't keep everyone else from
+            # getting their email
             try:
-                self.handle_facility(facility)
-            except:
+                template_data = self.template_data(facility)
+            except Exception:
                 logging.exception(
-                    f"Failed handling facility. (facility: '{facility.facility_name}; email: ({facility.contact_email})')"
+                    f"Failed handling facility. (facility: {facility.id_}; email: ({facility.contact_email}))"
+                )
+                continue  # Early Continuation
+
+            facilities.append(facility)
+            messages.append((facility.contact_email.lower().strip(), template_data))
+
+        if self.__dryrun:
+            return  # Early Return
+
+        outcomes = self.clients.email.send_transactional_templates(
+            messages,
+            self.clients.data.send_email_from,
+            self.clients.data.needs_template_id,
+            self.clients.data.unsubscribe_group_id,
+        )
+
+        for facility, (_, error) in zip(facilities, outcomes):
+            if error:
+                logging.error(
+                    f"Failed handling facility. (facility: '{facility.facility_name}; email: ({facility.contact_email}); error: {error})"
                 )
             else:
                 logging.info(
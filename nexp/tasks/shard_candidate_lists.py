@@ -0,0 +1,146 @@
+# nexp.tasks.shard_candidate_lists
+
+from typing import Any, Dict, List, Union
+from datetime import datetime
+import logging
+
+from nexp.clients.all import Clients
+from nexp.clients.checkpoints import Checkpoint
+from nexp.clients.messages import DirectoryQueue
+from nexp.config import config
+from nexp.deadline import Deadline
+from nexp.metrics import metrics
+from nexp.tasks.send_candidate_lists import SendCandidateLists
+
+
+class ShardCandidateLists:
+    """Splits sending candidate lists across workers. Given a filled database,
+    this publishes a snapshot of it, splits the facilities we need to send to
+    into shards, and puts a message on the queue for each shard. Workers load
+    the snapshot with run_shard and send their shard's lists, marking what
+    they finish in their own part of the checkpoint. Anything a shard doesn't
+    get to is left for the next invocation, which only shards what's still
+    pending."""
+
+    def __init__(
+        self,
+        clients: Clients,
+        queue: Any,
+        shards: Union[int, None] = None,
+        dryrun: bool = False,
+        checkpoint: Union[Checkpoint, None] = None,
+        dirpath: Union[str, None] = None,
+    ) -> None:
+        self.clients = clients
+        self.queue = queue
+        self.shards = max(shards or config.candidate_list_shards, 1)
+        self.__dryrun = dryrun
+        self.__checkpoint = checkpoint
+        self.__dirpath = dirpath
+
+    def partition(self, facility_ids: List[str]) -> List[List[str]]:
+        """Given facility ids in priority order, deal them out into shards so
+        that every shard gets its share of the most pressing ones"""
+        return [facility_ids[i :: self.shards] for i in range(self.shards)]
+
+    def __call__(self) -> List[Dict[str, Any]]:
+        runner = SendCandidateLists(self.clients, checkpoint=self.__checkpoint)
+        facility_ids = [f.id_ for f in runner.pending_facilities()]
+
+        # Earlier invocations' shards already got to everyone
+        if not facility_ids:
+            if self.__checkpoint and not self.__dryrun:
+                self.__checkpoint.save(complete=True)
+            logging.info("No facilities left to shard candidate lists for.")
+            return []
+
+        run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        snapshot = self.clients.snapshots.publish(
+            f"send-candidate-lists-{run_id}",
+            dirpath=self.__dirpath,
+            use_blobs=self.queue.remote,
+        )
+
+        messages = []
+        for shard, ids in enumerate(self.partition(facility_ids)):
+            if not ids:
+                continue  # Early Continuation
+
+            messages.append(
+                {
+                    "run": run_id,
+                    "shard": shard,
+                    "shards": self.shards,
+                    "snapshot": snapshot,
+                    "facility_ids": ids,
+                    "dryrun": self.__dryrun,
+                    "checkpoint": None,
+                }
+            )
+
+        # Each shard marks what it sends in its own part of the checkpoint,
+        # which has to be on record before any of them start
+        if self.__checkpoint and not self.__dryrun:
+            for message in messages:
+                part = f"shard-{run_id}-{message['shard']}"
+                self.__checkpoint.add_part(part)
+                message["checkpoint"] = {
+                    "name": self.__checkpoint.name,
+                    "date": self.__checkpoint.date,
+                    "part": part,
+                }
+            self.__checkpoint.save(complete=False)
+
+        for message in messages:
+            self.queue.put(message)
+
+        logging.info(
+            f"Queued candidate list shards. (run: {run_id}; shards: {len(messages)}; facilities: {len(facility_ids)})"
+        )
+        return messages
+
+
+def run_shard(
+    clients: Clients, message: Dict[str, Any], deadline: Union[Deadline, None] = None
+) -> None:
+    """Given clients with an empty database, a message queued by
+    ShardCandidateLists, and optionally a deadline, send that shard's
+    candidate lists"""
+    with metrics.timer("snapshot.restore"):
+        loaded = clients.snapshots.load_published(message["snapshot"])
+
+    if not loaded:
+        raise RuntimeError(
+            f"Could not load the snapshot for a candidate list shard. (run: {message['run']}; shard: {message['shard']})"
+        )
+
+    checkpoint = None
+    if message.get("checkpoint"):
+        checkpoint = clients.checkpoints.load(**message["checkpoint"])
+
+    SendCandidateLists(
+        clients,
+        dryrun=message.get("dryrun", False),
+        deadline=deadline,
+        checkpoint=checkpoint,
+        facility_ids=message["facility_ids"],
+    )()
+
+    logging.info(
+        f"Finished candidate list shard. (run: {message['run']}; shard: {message['shard']}; facilities: {len(message['facility_ids'])})"
+    )
+
+
+def work_directory_queue(dirpath: str) -> int:
+    """Given the directory of a DirectoryQueue, run shards off of it until it's
+    empty, each with fresh clients. Returns how many shards we ran. Meant to be
+    run in its own process."""
+    queue = DirectoryQueue(dirpath)
+    count = 0
+    while True:
+        message = queue.get()
+        if message is None:
+            return count
+
+        run_shard(Clients(), message)
+        count += 1
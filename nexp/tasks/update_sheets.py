@@ -4,10 +4,14 @@ from nexp.clients.all import Clients
 
 
 class UpdateSheets:
-    """Update our google sheets with everything in our google sheets"""
+    """Update our google sheets with everything in our google sheets. Only rows
+    that changed since the last run are written unless `full` is set."""
 
-    def __init__(self, clients: Clients, dryrun: bool = False) -> None:
+    def __init__(
+        self, clients: Clients, dryrun: bool = False, full: bool = False
+    ) -> None:
         self.clients = clients
+        self.full = full
 
     def __call__(self) -> None:
-        self.clients.data.fill_sheets()
+        self.clients.data.fill_sheets(full=self.full)
@@ -1,6 +1,6 @@
 # nexp.utils
 
-from typing import Any, Union
+from typing import Any, Callable, List, Union
 from datetime import datetime
 import pathlib
 
@@ -11,14 +11,15 @@ from nexp.config import config
 
 class Sheet:
     """
-    Sheet class
+    Sheet class. Rows are written top to bottom, one whole row at a time, so
+    that it works with workbooks opened in xlsxwriter's constant_memory mode.
     """
 
     def __init__(self, workbook, name) -> None:
         self.workbook = workbook
         self.name = name
         self.widths = {}
-        self.row = 1
+        self.row = 0
         self.data_sheet = self.create_worksheet()
 
     def create_worksheet(self):
@@ -31,23 +32,42 @@ class Sheet:
         for column_index, length in self.widths.items():
             self.data_sheet.set_column(column_index, column_index, length)
 
-    def write_candidates(self, candidates, cols):
+    def write_row(self, values: List[Any]) -> None:
+        """Given a row of values, write it below the last one and widen any
+        columns it doesn't fit in"""
+        self.data_sheet.write_row(self.row, 0, values)
+        widths = self.widths
+        for i, value in enumerate(values):
+            if value is None:
+                continue  # Early Continuation
+
+            value_length = len(str(value))
+            if value_length > widths.get(i, 0):
+                widths[i] = value_length
+
+        self.row += 1
+
+    def write_candidates(self, candidates, converters: List[Callable[[dict], Any]]):
+        """Given candidates and one converter per column (see
+        column_converters), write a row for each candidate"""
         for record in candidates:
-            for i, (key, _) in enumerate(cols):
-                value = getattr(record, key) if hasattr(record, key) else None
+            fields = record.fields
+            self.write_row([convert(fields) for convert in converters])
+
 
-                # A bunch of the data from airtable shows up as lists. We just
-                # comma delimit those when that's the case
-                if isinstance(value, list):
-                    value = ", ".join(value)
+def column_converters(cols) -> List[Callable[[dict], Any]]:
+    """Given (key, name) column pairs, return a function per column that pulls
+    that column's value out of a record's fields"""
 
-                self.data_sheet.write(self.row, i, value)
-                value_length = len(str(value))
+    def converter(key: str) -> Callable[[dict], Any]:
+        def convert(fields: dict) -> Any:
+            # A bunch of the data from airtable shows up as lists. We just
+            # comma delimit those when that's the case
+            return safe_list_convert(fields.get(key))
 
-                if value_length > self.widths[i]:
-                    self.set_widths(i, value_length)
+        return convert
 
-            self.row += 1
+    return [converter(key) for key, _ in cols]
 
 
 def datetime_now() -> datetime: